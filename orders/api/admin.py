@@ -4,9 +4,13 @@ from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
-from api.models import (Address, CartPosition, Category, Order, OrderPosition, Product, Recipient,
-                        Shop, ShopPosition, User,
+from api.models import (Address, ArchivedOrder, ArchivedOrderPosition,
+                        ArchivedShopPosition, CartPosition, Category,
+                        IdempotencyKey, Order, OrderPosition, OutboxEmail,
+                        Product, Recipient, Shop, ShopPosition, ShopSalesDay,
+                        StockHold, User, UserRecipient,
                         get_model_concrete_fields_names)
 
 
@@ -119,6 +123,11 @@ class ShopPositionAdmin(admin.ModelAdmin):
     list_filter = ['shop']
 
 
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = get_model_concrete_fields_names(StockHold)
+
+
 @admin.register(CartPosition)
 class CartPositionAdmin(admin.ModelAdmin):
     list_display = get_model_concrete_fields_names(CartPosition)
@@ -139,12 +148,65 @@ class RecipientAdmin(admin.ModelAdmin):
     inlines = [AddressInline]
 
 
+@admin.register(UserRecipient)
+class UserRecipientAdmin(admin.ModelAdmin):
+    list_display = get_model_concrete_fields_names(UserRecipient)
+    list_select_related = ['user']
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = get_model_concrete_fields_names(Order)
+    list_select_related = ['user']
 
 
 @admin.register(OrderPosition)
 class OrderPositionAdmin(admin.ModelAdmin):
     list_display = get_model_concrete_fields_names(OrderPosition)
     list_filter = ['order']
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'key', 'response_status', 'expires_at']
+
+
+@admin.register(ShopSalesDay)
+class ShopSalesDayAdmin(admin.ModelAdmin):
+    list_display = get_model_concrete_fields_names(ShopSalesDay)
+    list_filter = ['shop']
+    list_select_related = ['shop', 'product', 'category']
+
+
+class ArchivedOrderPositionInline(admin.TabularInline):
+    model = ArchivedOrderPosition
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at', 'delivired_at', 'status', 'user',
+                    'total_quantity', 'total_sum']
+    list_select_related = ['user']
+    inlines = [ArchivedOrderPositionInline]
+
+
+@admin.register(ArchivedShopPosition)
+class ArchivedShopPositionAdmin(admin.ModelAdmin):
+    list_display = get_model_concrete_fields_names(ArchivedShopPosition)
+    list_filter = ['shop']
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'to', 'bcc', 'status', 'attempts',
+                    'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status']
+    actions = ['requeue']
+
+    @admin.action(description='Поставить в очередь отправки повторно')
+    def requeue(self, request, queryset):
+        queryset.exclude(status=OutboxEmail.StatusChoices.SENT).update(
+            status=OutboxEmail.StatusChoices.PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now()
+        )
@@ -0,0 +1,123 @@
+'''
+Moving old data from hot tables to archive tables.
+
+Delivered and canceled orders older than ORDERS_ARCHIVE_AGE_DAYS are
+moved with their positions, recipients and addresses to ArchivedOrder
+and ArchivedOrderPosition. Archived shop positions not used in orders,
+carts and stock holds are moved to ArchivedShopPosition.
+'''
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from api.models import (ArchivedOrder, ArchivedOrderPosition,
+                        ArchivedShopPosition, Order, OrderPosition,
+                        ShopPosition)
+from api.serializers import RecipientSerializer
+
+
+ARCHIVED_ORDER_STATUSES = [Order.StatusChoices.DELIVERED,
+                           Order.StatusChoices.CANCELED]
+
+
+def archive_orders(age_days: int, batch_size: int) -> int:
+    'Moving old orders to archive tables by batches'
+    created_before = timezone.now() - timedelta(days=age_days)
+    archived_orders_count = 0
+    while True:
+        with transaction.atomic():
+            db_orders = list(
+                Order.objects
+                    .filter(status__in=ARCHIVED_ORDER_STATUSES,
+                            created_at__lt=created_before)
+                    .select_related('recipient__address')
+                    .prefetch_related(Prefetch(
+                        'positions',
+                        queryset=OrderPosition.objects
+                            .select_related('shop_position__product')
+                    ))
+                    .select_for_update(of=('self',))
+                    .order_by('pk')[:batch_size]
+            )
+            if not db_orders:
+                break
+
+            archived_orders = []
+            archived_orders_positions = []
+            for db_order in db_orders:
+                archived_orders.append(ArchivedOrder(
+                    id=db_order.pk,
+                    created_at=db_order.created_at,
+                    delivired_at=db_order.delivired_at,
+                    status=db_order.status,
+                    user_id=db_order.user_id,
+                    total_quantity=db_order.total_quantity,
+                    total_sum=db_order.total_sum,
+                    recipient=get_recipient_data(db_order)
+                ))
+                for db_order_pos in db_order.positions.all():
+                    archived_orders_positions.append(ArchivedOrderPosition(
+                        id=db_order_pos.pk,
+                        order_id=db_order.pk,
+                        shop_position=db_order_pos.shop_position_id,
+                        quantity=db_order_pos.quantity,
+                        shop_id=db_order_pos.shop_id,
+                        product_id=db_order_pos.shop_position.product_id,
+                        category_id=db_order_pos.shop_position.product
+                            .category_id,
+                        shop_name=db_order_pos.shop_name,
+                        product_name=db_order_pos.product_name,
+                        product_model=db_order_pos.product_model,
+                        price=db_order_pos.price,
+                        sum=db_order_pos.sum
+                    ))
+            ArchivedOrder.objects.bulk_create(archived_orders)
+            ArchivedOrderPosition.objects.bulk_create(
+                archived_orders_positions
+            )
+            Order.objects.filter(pk__in=[o.pk for o in db_orders]).delete()
+        archived_orders_count += len(db_orders)
+    return archived_orders_count
+
+def archive_shop_positions(batch_size: int) -> int:
+    'Moving archived shop positions not used anywhere to archive table'
+    archived_shop_positions_count = 0
+    while True:
+        with transaction.atomic():
+            db_shop_positions = list(
+                ShopPosition.objects
+                    .filter(archived_at__isnull=False,
+                            orders_positions=None,
+                            carts_positions=None,
+                            stock_holds=None)
+                    .order_by('pk')[:batch_size]
+            )
+            if not db_shop_positions:
+                break
+
+            ArchivedShopPosition.objects.bulk_create([
+                ArchivedShopPosition(
+                    id=db_shop_pos.pk,
+                    shop_id=db_shop_pos.shop_id,
+                    product_id=db_shop_pos.product_id,
+                    external_id=db_shop_pos.external_id,
+                    price=db_shop_pos.price,
+                    price_rrc=db_shop_pos.price_rrc,
+                    archived_at=db_shop_pos.archived_at
+                )
+                for db_shop_pos in db_shop_positions
+            ])
+            ShopPosition.objects\
+                .filter(pk__in=[p.pk for p in db_shop_positions])\
+                .delete()
+        archived_shop_positions_count += len(db_shop_positions)
+    return archived_shop_positions_count
+
+def get_recipient_data(db_order) -> dict | None:
+    try:
+        db_recipient = db_order.recipient
+    except Order.recipient.RelatedObjectDoesNotExist:
+        return None
+    return RecipientSerializer(db_recipient).data
@@ -0,0 +1,51 @@
+'''
+Async serving of read endpoints under ASGI.
+
+DRF views are synchronous, and under ASGI Django runs sync views one
+at a time in the single thread of the worker. Viewsets with
+AsyncReadViewSetMixin get async views (if ASYNC_READ_VIEWS is set),
+which run GET and HEAD requests in the thread pool of the worker event
+loop, so slow reads do not wait for each other. Other requests are
+run as before.
+'''
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AsyncReadViewSetMixin:
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not settings.ASYNC_READ_VIEWS:
+            return view
+        return get_async_view(view)
+
+
+def get_async_view(view):
+    def run_read_view(request, *args, **kwargs):
+        # Thread of the pool uses its own DB connection
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    read_view = sync_to_async(run_read_view, thread_sensitive=False)
+    write_view = sync_to_async(view, thread_sensitive=True)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read_view(request, *args, **kwargs)
+        return await write_view(request, *args, **kwargs)
+
+    # Copying name and attributes used by router and csrf middleware
+    update_wrapper(async_view, view)
+    return async_view
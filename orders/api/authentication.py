@@ -0,0 +1,116 @@
+'''
+Token authentication with cached token lookups.
+
+Users of tokens are kept in the bounded in-process LRU cache for
+TOKEN_AUTH_CACHE_TTL seconds and, if TOKEN_AUTH_SHARED_CACHE is set,
+in the Django cache shared by processes. Cached users of token are
+deleted when user or token is saved or deleted. Other processes keep
+their in-process entries until TTL expiration.
+'''
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.models import User
+
+
+class LRUCache:
+    def __init__(self, max_size: int, timeout: float):
+        self.max_size = max_size
+        self.timeout = timeout
+        # {key: (value, expiration time)}
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+local_cache = LRUCache(settings.TOKEN_AUTH_CACHE_SIZE,
+                       settings.TOKEN_AUTH_CACHE_TTL)
+
+
+def get_shared_cache_key(token_key: str) -> str:
+    return f'auth_token:{token_key}'
+
+def get_cached(token_key: str) -> tuple | None:
+    user_token = local_cache.get(token_key)
+    if user_token is None and settings.TOKEN_AUTH_SHARED_CACHE:
+        user_token = caches[settings.TOKEN_AUTH_CACHE_ALIAS]\
+            .get(get_shared_cache_key(token_key))
+        if user_token is not None:
+            local_cache.set(token_key, user_token)
+    return user_token
+
+def set_cached(token_key: str, user_token: tuple):
+    local_cache.set(token_key, user_token)
+    if settings.TOKEN_AUTH_SHARED_CACHE:
+        caches[settings.TOKEN_AUTH_CACHE_ALIAS].set(
+            get_shared_cache_key(token_key),
+            user_token,
+            settings.TOKEN_AUTH_CACHE_TTL
+        )
+
+def delete_cached(tokens_keys: list):
+    for token_key in tokens_keys:
+        local_cache.delete(token_key)
+    if settings.TOKEN_AUTH_SHARED_CACHE:
+        caches[settings.TOKEN_AUTH_CACHE_ALIAS].delete_many(
+            [get_shared_cache_key(token_key) for token_key in tokens_keys]
+        )
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        user_token = get_cached(key)
+        if user_token is None:
+            # Checking token and user by DB
+            user_token = super().authenticate_credentials(key)
+            set_cached(key, user_token)
+        user, token = user_token
+        # Request gets its own copy of cached user
+        return copy.copy(user), token
+
+
+# Deleting cached users of tokens on changing users (including
+# deactivation and password change) and tokens
+
+@receiver(post_save, sender=User)
+def delete_cached_user_tokens(sender, instance, **kwargs):
+    delete_cached(
+        list(Token.objects.filter(user=instance).values_list('key',
+                                                             flat=True))
+    )
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def delete_cached_token(sender, instance, **kwargs):
+    delete_cached([instance.key])
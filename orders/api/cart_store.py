@@ -0,0 +1,344 @@
+'''
+Storages of users carts.
+
+DB storage (CART_STORAGE = 'db') keeps carts in CartPosition table.
+
+Cache storage (CART_STORAGE = 'cache') keeps active carts in the Django
+cache as {shop position id: quantity} and writes them to CartPosition
+table later: at checkout or by "flush_carts" management command.
+Cart positions of cache storage are identified by shop position id.
+The cache must be shared by processes (Redis, Memcached), changes of
+the cart are serialized by the lock kept in the cache. Changed carts
+do not expire until they are written to DB.
+'''
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from api.models import CartPosition, ShopPosition, User
+
+
+class CartLocked(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Cart is being changed by another request, try again.'
+    default_code = 'cart_locked'
+
+
+class DBCartStore:
+    def get_positions(self, user):
+        return CartPosition.objects\
+            .filter(user=user)\
+            .with_sums()\
+            .select_related('shop_position__shop',
+                            'shop_position__product__category')\
+            .prefetch_related(
+                'shop_position__product__parameters__parameter_name'
+            )
+
+    def get_position(self, user, pk) -> CartPosition:
+        return get_object_or_404(CartPosition.objects.filter(user=user),
+                                 pk=pk)
+
+    def get_totals(self, user, positions) -> dict:
+        # Calculating totals by DB
+        return CartPosition.objects.filter(user=user).get_totals()
+
+    def add_position(self, user, shop_position,
+                     quantity: int) -> CartPosition:
+        return CartPosition.objects.create(
+            user=user,
+            shop_position=shop_position,
+            quantity=quantity
+        )
+
+    def update_position(self, position: CartPosition,
+                        **fields) -> CartPosition:
+        for field_name, value in fields.items():
+            setattr(position, field_name, value)
+        position.save()
+        return position
+
+    def delete_position(self, position: CartPosition):
+        position.delete()
+
+    @contextmanager
+    def lock(self, user):
+        'Locking cart of user for changing its state'
+        with transaction.atomic():
+            # Locking user row, so changes of the cart are serialized
+            list(User.objects.select_for_update()
+                 .filter(pk=user.pk).values_list('pk'))
+            yield
+
+    def get_state(self, user) -> dict:
+        return CartPosition.objects.get_state(user)
+
+    def set_state(self, user, cart_state: dict):
+        CartPosition.objects.save_state(user, cart_state)
+
+    def flush(self, user):
+        # Cart is already in DB
+        pass
+
+    def clear(self, user):
+        CartPosition.objects.filter(user=user).delete()
+
+
+class CacheCartStore:
+    KEY_PREFIX = 'cart'
+    # Lock expires if its request fails without releasing it
+    LOCK_TIMEOUT = 10
+    # Time of waiting for the lock taken by other request
+    LOCK_WAIT = 5
+    LOCK_POLL_INTERVAL = 0.01
+    # Missing record of log of changed carts is skipped after this time,
+    # request which has taken its number has failed
+    DIRTY_RECORD_WAIT = 60
+
+    def __init__(self, cache_alias: str, timeout: int):
+        self.cache = caches[cache_alias]
+        self.timeout = timeout
+        self.db_store = DBCartStore()
+        # Versions of carts locked by this store
+        self.locked_versions = dict()
+
+    def get_cart_key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:{user_id}'
+
+    def get_lock_key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:lock:{user_id}'
+
+    def get_cart(self, user) -> dict:
+        cart = self.cache.get(self.get_cart_key(user.pk))
+        if cart is None:
+            # Loading cart from DB, cart saved by other request
+            # meanwhile is not overwritten
+            cart = {
+                'positions': self.db_store.get_state(user),
+                'version': 0,
+                'dirty': False
+            }
+            if not self.cache.add(self.get_cart_key(user.pk), cart,
+                                  self.timeout):
+                return self.get_cart(user)
+        return cart
+
+    @contextmanager
+    def lock(self, user):
+        'Locking cart of user for changing its state'
+        if user.pk in self.locked_versions:
+            # Cart is already locked by this store
+            yield
+            return
+
+        lock_key = self.get_lock_key(user.pk)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while not self.cache.add(lock_key, token, self.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise CartLocked()
+            time.sleep(self.LOCK_POLL_INTERVAL)
+        self.locked_versions[user.pk] = self.get_cart(user)['version']
+        try:
+            yield
+        finally:
+            del self.locked_versions[user.pk]
+            # Not releasing the lock expired and taken by other request
+            if self.cache.get(lock_key) == token:
+                self.cache.delete(lock_key)
+
+    def get_state(self, user) -> dict:
+        return self.get_cart(user)['positions'].copy()
+
+    def set_state(self, user, cart_state: dict):
+        with self.lock(user):
+            cart = self.get_cart(user)
+            if cart['version'] != self.locked_versions[user.pk]:
+                # Lock has expired and cart was changed by other request
+                raise CartLocked()
+            was_dirty = cart['dirty']
+            cart = {
+                'positions': cart_state,
+                'version': cart['version'] + 1,
+                'dirty': True
+            }
+            # Changed cart does not expire until it is written to DB
+            self.cache.set(self.get_cart_key(user.pk), cart, timeout=None)
+            self.locked_versions[user.pk] = cart['version']
+            if not was_dirty:
+                self.log_dirty_user(user.pk)
+
+    def get_positions(self, user) -> list[CartPosition]:
+        cart_state = self.get_state(user)
+        db_shop_positions = ShopPosition.objects\
+            .select_related('shop', 'product__category')\
+            .prefetch_related('product__parameters__parameter_name')\
+            .in_bulk(cart_state.keys())
+        positions = []
+        for shop_pos_id, cart_pos_qnt in sorted(cart_state.items()):
+            db_shop_pos = db_shop_positions.get(shop_pos_id)
+            if db_shop_pos is None:
+                # Shop position was deleted
+                continue
+            positions.append(
+                self.make_position(user, db_shop_pos, cart_pos_qnt)
+            )
+        return positions
+
+    def get_position(self, user, pk) -> CartPosition:
+        try:
+            shop_pos_id = int(pk)
+        except ValueError:
+            raise Http404
+        cart_pos_qnt = self.get_state(user).get(shop_pos_id)
+        if cart_pos_qnt is None:
+            raise Http404
+        db_shop_pos = get_object_or_404(ShopPosition, pk=shop_pos_id)
+        return self.make_position(user, db_shop_pos, cart_pos_qnt)
+
+    def get_totals(self, user, positions) -> dict:
+        return {
+            'total_quantity': sum(p.quantity for p in positions),
+            'total_sum': sum((p.sum for p in positions), Decimal(0))
+        }
+
+    def add_position(self, user, shop_position,
+                     quantity: int) -> CartPosition:
+        with self.lock(user):
+            cart_state = self.get_state(user)
+            if shop_position.pk in cart_state:
+                errors = {
+                    'shop_position': [
+                        'This shop position is already in the cart.'
+                    ]
+                }
+                raise serializers.ValidationError(errors)
+            cart_state[shop_position.pk] = quantity
+            self.set_state(user, cart_state)
+        return self.make_position(user, shop_position, quantity)
+
+    def update_position(self, position: CartPosition,
+                        **fields) -> CartPosition:
+        shop_position = fields.get('shop_position', position.shop_position)
+        quantity = fields.get('quantity', position.quantity)
+        with self.lock(position.user):
+            cart_state = self.get_state(position.user)
+            if shop_position.pk != position.pk:
+                if shop_position.pk in cart_state:
+                    errors = {
+                        'shop_position': [
+                            'This shop position is already in the cart.'
+                        ]
+                    }
+                    raise serializers.ValidationError(errors)
+                cart_state.pop(position.pk, None)
+            cart_state[shop_position.pk] = quantity
+            self.set_state(position.user, cart_state)
+        return self.make_position(position.user, shop_position, quantity)
+
+    def delete_position(self, position: CartPosition):
+        with self.lock(position.user):
+            cart_state = self.get_state(position.user)
+            cart_state.pop(position.pk, None)
+            self.set_state(position.user, cart_state)
+
+    def flush(self, user):
+        'Writing user cart from cache to DB'
+        with self.lock(user):
+            cart = self.cache.get(self.get_cart_key(user.pk))
+            if cart is None or not cart['dirty']:
+                return
+            self.db_store.set_state(user, cart['positions'])
+
+            # Marking cart as clean, now it can expire
+            cart['dirty'] = False
+            self.cache.set(self.get_cart_key(user.pk), cart, self.timeout)
+
+    def clear(self, user):
+        with self.lock(user):
+            self.db_store.clear(user)
+            self.cache.delete(self.get_cart_key(user.pk))
+
+    def make_position(self, user, shop_position,
+                      quantity: int) -> CartPosition:
+        position = CartPosition(
+            id=shop_position.pk,
+            user=user,
+            shop_position=shop_position,
+            quantity=quantity
+        )
+        position.sum = shop_position.price * quantity
+        return position
+
+    # Log of users with changed carts.
+    # Every record is stored under its own key with number
+    # taken from atomic counter, so no records are lost
+    # when carts are changed concurrently.
+    def log_dirty_user(self, user_id):
+        counter_key = f'{self.KEY_PREFIX}:dirty_counter'
+        self.cache.add(counter_key, 0, timeout=None)
+        record_num = self.cache.incr(counter_key)
+        self.cache.set(f'{self.KEY_PREFIX}:dirty:{record_num}', user_id,
+                       timeout=None)
+
+    def pop_dirty_users_ids(self) -> set:
+        'Getting and deleting users ids from log of changed carts'
+        counter_key = f'{self.KEY_PREFIX}:dirty_counter'
+        flushed_counter_key = f'{self.KEY_PREFIX}:flushed_counter'
+        last_record_num = self.cache.get(counter_key, 0)
+        first_record_num = self.cache.get(flushed_counter_key, 0) + 1
+        records_keys = {
+            record_num: f'{self.KEY_PREFIX}:dirty:{record_num}'
+            for record_num in range(first_record_num, last_record_num + 1)
+        }
+        records = self.cache.get_many(records_keys.values())
+
+        # Records are popped in order up to the first missing one:
+        # its number is taken from the counter, but the record may be
+        # not written yet. It will be got next time.
+        flushed_record_num = first_record_num - 1
+        for record_num, record_key in records_keys.items():
+            if (
+                record_key not in records
+                and not self.is_dirty_record_lost(record_num)
+            ):
+                break
+            flushed_record_num = record_num
+        if flushed_record_num < first_record_num:
+            return set()
+
+        self.cache.set(flushed_counter_key, flushed_record_num, timeout=None)
+        popped_records_nums = range(first_record_num, flushed_record_num + 1)
+        self.cache.delete_many(
+            [records_keys[record_num] for record_num in popped_records_nums]
+            + [f'{self.KEY_PREFIX}:missing:{record_num}'
+               for record_num in popped_records_nums]
+        )
+        return set(
+            records[records_keys[record_num]]
+            for record_num in popped_records_nums
+            if records_keys[record_num] in records
+        )
+
+    def is_dirty_record_lost(self, record_num: int) -> bool:
+        'Checking if missing record is not written for too long'
+        missing_key = f'{self.KEY_PREFIX}:missing:{record_num}'
+        self.cache.add(missing_key, time.time(), timeout=None)
+        missing_since = self.cache.get(missing_key, time.time())
+        return time.time() - missing_since > self.DIRTY_RECORD_WAIT
+
+
+def get_cart_store():
+    if settings.CART_STORAGE == 'cache':
+        return CacheCartStore(settings.CART_CACHE_ALIAS,
+                              settings.CART_CACHE_TIMEOUT)
+    return DBCartStore()
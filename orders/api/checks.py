@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+# Backends keeping data in the memory of the process
+PER_PROCESS_CACHE_BACKENDS = (DummyCache, LocMemCache)
+
+
+def is_shared_cache(cache_alias: str) -> bool:
+    return not isinstance(caches[cache_alias], PER_PROCESS_CACHE_BACKENDS)
+
+
+@register()
+def check_cart_storage(app_configs, **kwargs):
+    errors = []
+    if (
+        settings.CART_STORAGE == 'cache'
+        and not is_shared_cache(settings.CART_CACHE_ALIAS)
+    ):
+        errors.append(Error(
+            'Cache storage of carts requires the cache shared by processes.',
+            hint=('Set CACHE_BACKEND to Redis or Memcached backend'
+                  ' or set CART_STORAGE to "db".'),
+            id='api.E001'
+        ))
+    return errors
+
+
+@register()
+def check_db_replicas(app_configs, **kwargs):
+    errors = []
+    if (
+        settings.DB_REPLICAS
+        and not is_shared_cache(settings.DB_REPLICA_PIN_CACHE_ALIAS)
+    ):
+        errors.append(Error(
+            'Pinning users to the primary database after changes requires'
+            ' the cache shared by processes.',
+            hint=('Set CACHE_BACKEND to Redis or Memcached backend'
+                  ' or do not set DB_REPLICAS.'),
+            id='api.E002'
+        ))
+    return errors
@@ -0,0 +1,147 @@
+'''
+Storages of confirmation codes.
+
+DB storage (CONFIRMATION_CODE_STORAGE = 'db') keeps codes in
+ConfirmationCode table, expired codes are deleted by
+"delete_expired_confirmation_codes" management command.
+
+Cache storage (CONFIRMATION_CODE_STORAGE = 'cache') keeps codes in the
+Django cache, expired codes are deleted by the cache.
+
+Codes expire CONFIRMATION_CODE_TTL seconds after creation and are
+deleted after CONFIRMATION_CODE_MAX_ATTEMPTS invalid attempts.
+'''
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import ConfirmationCode
+
+
+class DBConfirmationCodeStore:
+    def get_expired(self):
+        return ConfirmationCode.objects\
+            .filter(created_at__lte=get_expiration_border())
+
+    def create(self, user) -> str:
+        db_code, _ = ConfirmationCode.objects.update_or_create(
+            user=user,
+            defaults={
+                'value': ConfirmationCode.generate(),
+                'created_at': timezone.now(),
+                'sent_at': None,
+                'attempts': 0
+            }
+        )
+        return db_code.value
+
+    def check(self, user, value: str) -> bool | None:
+        '''
+        Returns True for valid code, False for invalid one
+        and None if there is no code for user.
+        '''
+        db_code = ConfirmationCode.objects\
+            .filter(user=user, created_at__gt=get_expiration_border())\
+            .first()
+        if db_code is None:
+            return None
+        if value == db_code.value:
+            return True
+
+        # Counting invalid attempt
+        ConfirmationCode.objects\
+            .filter(pk=db_code.pk)\
+            .update(attempts=F('attempts') + 1)
+        ConfirmationCode.objects\
+            .filter(pk=db_code.pk,
+                    attempts__gte=settings.CONFIRMATION_CODE_MAX_ATTEMPTS)\
+            .delete()
+        return False
+
+    def delete(self, user):
+        ConfirmationCode.objects.filter(user=user).delete()
+
+    def mark_sent(self, user_id, value: str):
+        ConfirmationCode.objects\
+            .filter(user_id=user_id, value=value)\
+            .update(sent_at=timezone.now())
+
+
+class CacheConfirmationCodeStore:
+    KEY_PREFIX = 'confirmation_code'
+
+    def __init__(self, cache_alias: str, timeout: int):
+        self.cache = caches[cache_alias]
+        self.timeout = timeout
+
+    def get_code_key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:{user_id}'
+
+    def get_attempts_key(self, user_id) -> str:
+        return f'{self.KEY_PREFIX}:{user_id}:attempts'
+
+    def create(self, user) -> str:
+        value = ConfirmationCode.generate()
+        code = {
+            'value': value,
+            'created_at': timezone.now(),
+            'sent_at': None
+        }
+        self.cache.set(self.get_code_key(user.pk), code, self.timeout)
+        self.cache.delete(self.get_attempts_key(user.pk))
+        return value
+
+    def check(self, user, value: str) -> bool | None:
+        '''
+        Returns True for valid code, False for invalid one
+        and None if there is no code for user.
+        '''
+        code = self.cache.get(self.get_code_key(user.pk))
+        if code is None:
+            return None
+        if value == code['value']:
+            return True
+
+        # Counting invalid attempt by atomic counter
+        attempts_key = self.get_attempts_key(user.pk)
+        self.cache.add(attempts_key, 0, self.timeout)
+        try:
+            attempts = self.cache.incr(attempts_key)
+        except ValueError:
+            # Counter expired or was evicted after adding, the code
+            # is treated as expired so that attempts are not reset
+            self.delete(user)
+            return None
+        if attempts >= settings.CONFIRMATION_CODE_MAX_ATTEMPTS:
+            self.delete(user)
+        return False
+
+    def delete(self, user):
+        self.cache.delete_many([self.get_code_key(user.pk),
+                                self.get_attempts_key(user.pk)])
+
+    def mark_sent(self, user_id, value: str):
+        code = self.cache.get(self.get_code_key(user_id))
+        if code is None or code['value'] != value:
+            return
+        code['sent_at'] = timezone.now()
+        timeout = self.timeout\
+            - (code['sent_at'] - code['created_at']).total_seconds()
+        if timeout > 0:
+            self.cache.set(self.get_code_key(user_id), code, timeout)
+
+
+def get_expiration_border():
+    'Codes created before this time are expired'
+    return timezone.now() - timedelta(seconds=settings.CONFIRMATION_CODE_TTL)
+
+def get_confirmation_code_store():
+    if settings.CONFIRMATION_CODE_STORAGE == 'cache':
+        return CacheConfirmationCodeStore(
+            settings.CONFIRMATION_CODE_CACHE_ALIAS,
+            settings.CONFIRMATION_CODE_TTL
+        )
+    return DBConfirmationCodeStore()
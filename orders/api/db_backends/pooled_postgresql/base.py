@@ -0,0 +1,56 @@
+'''
+PostgreSQL backend with pool of connections (psycopg 3 and psycopg_pool).
+
+Connections are taken from the pool of the process instead of
+connecting to the server and returned to the pool instead of closing.
+Pool is configured by "POOL" dict of the database settings
+(min_size, max_size, timeout, max_idle), connections are checked
+before being given out of the pool.
+'''
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import (IsolationLevel,
+                                                       is_psycopg3)
+
+
+# Pools of the process by database alias
+pools = dict()
+pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_pool(self):
+        with pools_lock:
+            if self.alias not in pools:
+                if not is_psycopg3:
+                    raise ImproperlyConfigured(
+                        'Pool of connections requires psycopg 3.'
+                    )
+                from psycopg_pool import ConnectionPool
+
+                pools[self.alias] = ConnectionPool(
+                    kwargs=self.get_connection_params(),
+                    check=ConnectionPool.check_connection,
+                    open=True,
+                    **self.settings_dict.get('POOL', {})
+                )
+            return pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level =\
+                IsolationLevel(options['isolation_level'])
+        except KeyError:
+            self.isolation_level = IsolationLevel.READ_COMMITTED
+        connection = self.get_pool().getconn()
+        connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        'Returning connection to the pool'
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool().putconn(self.connection)
@@ -0,0 +1,97 @@
+'''
+Routing of reads to replicas of the database.
+
+Safe requests to viewsets with ReplicaReadViewSetMixin read from the
+random replica of DB_REPLICAS, all other queries go to the primary
+("default") database. After unsafe request of the user (changing cart,
+creating order, importing positions etc.) the user is pinned to the
+primary database for DB_REPLICA_PIN_TIME seconds, so the user does not
+read data of replica which has not got the changes yet. Pins are kept
+in the Django cache, which must be shared by processes (system check
+api.E002 rejects per-process cache backends).
+'''
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Reading from replicas is allowed in the current request
+use_replicas = ContextVar('use_replicas', default=False)
+
+
+def get_pin_key(user_id) -> str:
+    return f'db_primary_pin:{user_id}'
+
+def pin_to_primary(user):
+    caches[settings.DB_REPLICA_PIN_CACHE_ALIAS].set(
+        get_pin_key(user.pk),
+        True,
+        settings.DB_REPLICA_PIN_TIME
+    )
+
+def is_pinned_to_primary(user) -> bool:
+    return bool(
+        caches[settings.DB_REPLICA_PIN_CACHE_ALIAS].get(get_pin_key(user.pk))
+    )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if settings.DB_REPLICAS and use_replicas.get():
+            return random.choice(settings.DB_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Objects read from replica are saved to the primary too
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas have the same data as the primary
+        dbs = {DEFAULT_DB_ALIAS, *settings.DB_REPLICAS}
+        if obj1._state.db in dbs and obj2._state.db in dbs:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get tables by replication
+        if db in settings.DB_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadViewSetMixin:
+    def dispatch(self, request, *args, **kwargs):
+        token = use_replicas.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            use_replicas.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Reading from replicas if user has not changed data recently
+        if (
+            settings.DB_REPLICAS
+            and request.method in SAFE_METHODS
+            and request.user.is_authenticated
+            and not is_pinned_to_primary(request.user)
+        ):
+            use_replicas.set(True)
+
+
+class PrimaryPinMiddleware(MiddlewareMixin):
+    'Pinning user to the primary database after unsafe request'
+    def process_response(self, request, response):
+        if not settings.DB_REPLICAS or request.method in SAFE_METHODS:
+            return response
+        # User is set to the request by authentication of view
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user)
+        return response
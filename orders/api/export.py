@@ -0,0 +1,151 @@
+'''
+Export of shops orders positions to CSV and XLSX files.
+
+Rows are read from DB through iterator (server-side cursor
+on PostgreSQL) and written to response by chunks, so memory usage
+does not depend on number of exported rows. Under ASGI, CSV rows and
+the XLSX file are read by async iterators, because Django collects sync
+streaming content to the list before sending it to ASGI server.
+
+XLSX file can not be streamed: write-only workbook writes rows (with
+inline strings) to temporary file on disk, so memory usage does not
+depend on number of rows, but the response is started only after
+all rows are read and the file takes disk space of the export size.
+'''
+import csv
+import tempfile
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+
+
+CHUNK_SIZE = 2000
+FILE_CHUNK_SIZE = 64 * 1024
+
+HEADER = ['order_id', 'created_at', 'status', 'recipient', 'product',
+          'quantity', 'price', 'sum']
+
+FILE_FORMATS = ['csv', 'xlsx']
+
+
+def get_rows(db_orders_positions):
+    yield HEADER
+    db_rows = db_orders_positions\
+        .order_by('order_id', 'pk')\
+        .values_list(
+            'order_id',
+            'order__created_at',
+            'order__status',
+            'order__recipient__last_name',
+            'order__recipient__first_name',
+            'order__recipient__patronymic',
+            'product_name',
+            'quantity',
+            'price',
+            'sum'
+        )\
+        .iterator(chunk_size=CHUNK_SIZE)
+    for (order_id, created_at, status, last_name, first_name, patronymic,
+         product_name, quantity, price, position_sum) in db_rows:
+        yield [
+            order_id,
+            created_at.isoformat(),
+            status,
+            # Recipient cell is empty for orders without recipient
+            ' '.join(filter(None, (last_name, first_name, patronymic)))
+                or None,
+            product_name,
+            quantity,
+            price,
+            position_sum
+        ]
+
+def get_rows_chunks(db_orders_positions):
+    rows = get_rows(db_orders_positions)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        yield chunk
+
+async def aget_rows(db_orders_positions):
+    # Reading chunks of rows in the thread of sync code, QuerySet
+    # aiterator() of values_list() executes query in async context
+    rows_chunks = get_rows_chunks(db_orders_positions)
+    while chunk := await sync_to_async(next)(rows_chunks, None):
+        for row in chunk:
+            yield row
+
+
+class Echo:
+    'File-like object returning written value instead of storing it'
+    def write(self, value):
+        return value
+
+
+async def aget_csv_lines(db_orders_positions):
+    writer = csv.writer(Echo())
+    async for row in aget_rows(db_orders_positions):
+        yield writer.writerow(row)
+
+def get_csv_lines(db_orders_positions):
+    writer = csv.writer(Echo())
+    for row in get_rows(db_orders_positions):
+        yield writer.writerow(row)
+
+def get_csv_response(db_orders_positions, filename: str,
+                     is_async: bool = False) -> StreamingHttpResponse:
+    if is_async:
+        streaming_content = aget_csv_lines(db_orders_positions)
+    else:
+        streaming_content = get_csv_lines(db_orders_positions)
+    response = StreamingHttpResponse(streaming_content,
+                                     content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+async def aread_file(file):
+    'Reading file by chunks in the thread of sync code'
+    try:
+        while chunk := await sync_to_async(file.read)(FILE_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+def get_xlsx_response(db_orders_positions, filename: str,
+                      is_async: bool = False) -> StreamingHttpResponse:
+    # Workbook in write-only mode does not keep rows in memory,
+    # strings are written inline without shared strings table
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    for row in get_rows(db_orders_positions):
+        worksheet.append(row)
+
+    # Saving workbook to temporary file streamed by response
+    xlsx_file = tempfile.TemporaryFile()
+    workbook.save(xlsx_file)
+    xlsx_file.seek(0)
+    content_type = ('application/vnd.openxmlformats-officedocument'
+                    '.spreadsheetml.sheet')
+    if is_async:
+        response = StreamingHttpResponse(aread_file(xlsx_file),
+                                         content_type=content_type)
+        response['Content-Disposition'] =\
+            f'attachment; filename="{filename}"'
+        return response
+    return FileResponse(
+        xlsx_file,
+        as_attachment=True,
+        filename=filename,
+        content_type=content_type
+    )
+
+def get_export_response(db_orders_positions, file_format: str,
+                        is_async: bool = False):
+    '''
+    Getting response with exported file, is_async is set
+    if request is served by ASGI server.
+    '''
+    filename = f'orders.{file_format}'
+    if file_format == 'xlsx':
+        return get_xlsx_response(db_orders_positions, filename, is_async)
+    return get_csv_response(db_orders_positions, filename, is_async)
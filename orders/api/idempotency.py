@@ -0,0 +1,91 @@
+'''
+Idempotency of requests with "Idempotency-Key" header.
+
+Response of the first successful request with the key is stored and
+returned for repeated requests with the same key without running the
+request again. Concurrent requests with the same key wait for the first
+one on the key row lock.
+'''
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from api.models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyKeyConflict(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This key was already used with other request data.'
+    default_code = 'idempotency_key_conflict'
+
+
+def get_request_hash(request) -> str:
+    request_data = json.dumps(request.data, sort_keys=True,
+                              cls=DjangoJSONEncoder)
+    return hashlib.sha256(request_data.encode()).hexdigest()
+
+def get_idempotent_response(request, get_response) -> tuple[Response, bool]:
+    '''
+    Returns response of get_response() or stored response for request
+    key and flag whether response was replayed.
+    '''
+    key = request.headers[HEADER]
+    if len(key) > IdempotencyKey.MAX_LENGTH:
+        errors = {
+            HEADER: [f'Ensure this header has no more than'
+                     f' {IdempotencyKey.MAX_LENGTH} characters.']
+        }
+        raise ValidationError(errors)
+    request_hash = get_request_hash(request)
+
+    # Getting or creating key in separate transaction,
+    # so concurrent requests can find it
+    IdempotencyKey.objects\
+        .filter(user=request.user, key=key,
+                expires_at__lte=timezone.now())\
+        .delete()
+    db_key, _ = IdempotencyKey.objects.get_or_create(
+        user=request.user,
+        key=key,
+        defaults={
+            'request_hash': request_hash,
+            'expires_at': timezone.now()
+                + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        }
+    )
+
+    with transaction.atomic():
+        # Waiting for concurrent request with the same key
+        db_key = IdempotencyKey.objects.select_for_update().get(pk=db_key.pk)
+        if db_key.request_hash != request_hash:
+            raise IdempotencyKeyConflict()
+
+        # Replaying stored response
+        if db_key.response_status is not None:
+            response = Response(db_key.response_data,
+                                db_key.response_status)
+            response[REPLAYED_HEADER] = 'true'
+            return response, True
+
+        # Exception rolls back changes, so request can be repeated
+        response = get_response()
+
+        # Storing successful response
+        if status.is_success(response.status_code):
+            db_key.response_status = response.status_code
+            db_key.response_data = response.data
+            db_key.save(update_fields=['response_status', 'response_data'])
+
+    return response, False
@@ -0,0 +1,414 @@
+'''
+Load testing of the running application by scripted user journeys.
+
+Customers sign up, verify email by the code caught by the local SMTP
+sink, sign in, browse and search products, fill cart, place order and
+get their orders. Shop representatives import shop positions and
+review orders of their shops. Journeys are repeated by concurrent
+virtual users, every request is recorded as a step of the journey.
+'''
+import email
+import http.client
+import json
+import math
+import socketserver
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+import yaml
+from rest_framework.authtoken.models import Token
+
+from api.models import Shop, User
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    'Minimal SMTP server keeping received messages instead of sending'
+    def handle(self):
+        self.reply('220 load test SMTP sink')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 load test SMTP sink')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(
+                    command.split(':', 1)[1].strip().strip('<>').lower()
+                )
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.server.sink.add(recipients, self.read_data())
+                self.reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                return b''.join(lines)
+            # Removing dot stuffing
+            if line.startswith(b'..'):
+                line = line[1:]
+            lines.append(line)
+
+    def reply(self, text: str):
+        self.wfile.write(f'{text}\r\n'.encode('ascii'))
+
+
+class SMTPSink:
+    'Bodies of received messages by recipients'
+    def __init__(self, host: str, port: int):
+        self.messages = defaultdict(list)
+        self.condition = threading.Condition()
+        self.server = socketserver.ThreadingTCPServer((host, port),
+                                                      SMTPSinkHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add(self, recipients: list, data: bytes):
+        message = email.message_from_bytes(data)
+        body = message.get_payload(decode=True)\
+            .decode(message.get_content_charset() or 'utf-8')
+        with self.condition:
+            for recipient in recipients:
+                self.messages[recipient].append(body.strip())
+            self.condition.notify_all()
+
+    def wait_message(self, recipient: str, timeout: float) -> str | None:
+        'Waiting for the first message to recipient'
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.messages.get(recipient.lower()),
+                timeout
+            )
+            messages = self.messages.get(recipient.lower())
+            return messages[0] if messages else None
+
+
+class Stats:
+    'Latencies and errors of steps'
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def add(self, step: str, latency: float, error: str = None):
+        with self.lock:
+            self.latencies[step].append(latency)
+            if error:
+                self.errors[step][error] += 1
+
+    def get_report(self, duration: float) -> list[dict]:
+        report = []
+        for step, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            errors_count = sum(self.errors[step].values())
+            report.append({
+                'step': step,
+                'requests': len(latencies),
+                'throughput': len(latencies) / duration,
+                'p50': get_percentile(latencies, 50),
+                'p95': get_percentile(latencies, 95),
+                'p99': get_percentile(latencies, 99),
+                'error_rate': errors_count / len(latencies),
+                'errors': dict(self.errors[step])
+            })
+        return report
+
+
+def get_percentile(sorted_values: list, percent: int) -> float:
+    'Nearest-rank percentile'
+    index = math.ceil(percent / 100 * len(sorted_values)) - 1
+    return sorted_values[max(index, 0)]
+
+
+class StepError(Exception):
+    pass
+
+
+class Client:
+    'HTTP client of virtual user with keep-alive connection'
+    def __init__(self, base_url: str, stats: Stats, timeout: float):
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection\
+            if url.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(url.hostname, url.port,
+                                           timeout=timeout)
+        self.stats = stats
+        self.token = None
+
+    def request(self, step: str, method: str, path: str,
+                expected_status: int, data=None, files: dict = None):
+        headers = {}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        if files:
+            body, headers['Content-Type'] = encode_multipart(files)
+        elif data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        else:
+            body = None
+
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.connection.close()
+            self.stats.add(step, time.perf_counter() - start,
+                           type(e).__name__)
+            raise StepError(step)
+        latency = time.perf_counter() - start
+
+        if response.status != expected_status:
+            self.stats.add(step, latency, f'HTTP {response.status}')
+            raise StepError(step)
+        self.stats.add(step, latency)
+        return json.loads(content) if content else None
+
+    def close(self):
+        self.connection.close()
+
+
+def encode_multipart(files: dict) -> tuple[bytes, str]:
+    'Encoding files {field name: (file name, content)} to multipart body'
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field_name, (file_name, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}";'
+            f' filename="{file_name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+            + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def get_import_file(shop_name: str, products_number: int) -> bytes:
+    'Generating import file of shop positions'
+    data = {
+        'shop': shop_name,
+        'categories': [
+            {'id': i, 'name': f'Нагрузочный тест {i}'} for i in range(10)
+        ],
+        'goods': [
+            {
+                'id': i,
+                'category': i % 10,
+                'model': f'lt-{i}',
+                'name': f'Товар нагрузочного теста {i}',
+                'price': 100 + i,
+                'price_rrc': 120 + i,
+                'quantity': 1000000,
+                'parameters': {
+                    'Цвет': ('белый', 'чёрный', 'серый')[i % 3],
+                    'Вес': i
+                }
+            }
+            for i in range(products_number)
+        ]
+    }
+    return yaml.dump(data, allow_unicode=True).encode()
+
+
+class LoadTest:
+    SHOP_NAME = 'Нагрузочный тест'
+    IMPORT_SHOP_NAME = 'Нагрузочный тест (импорт)'
+    REPRESENTATIVE_EMAIL = 'load-test-representative@example.com'
+    PASSWORD = 'Load-test-password-1'
+    RECIPIENT_DATA = {
+        'recipient': {
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'patronymic': 'Иванович',
+            'email': 'load-test-recipient@example.com',
+            'phone': '+79990000000',
+            'address': {
+                'city': 'Москва',
+                'street': 'Тверская',
+                'house_number': '1',
+                'house_block': '1',
+                'house_building': '1',
+                'appartment': '1'
+            }
+        }
+    }
+
+    def __init__(self, base_url: str, sink: SMTPSink, products_number: int,
+                 cart_size: int, email_timeout: float,
+                 request_timeout: float):
+        self.base_url = base_url
+        self.sink = sink
+        self.products_number = products_number
+        self.cart_size = cart_size
+        self.email_timeout = email_timeout
+        self.request_timeout = request_timeout
+        self.stats = Stats()
+        self.representative_token = None
+
+    def setup(self):
+        'Creating representative of shops and importing catalog shop'
+        db_representative = User.objects\
+            .filter(email=self.REPRESENTATIVE_EMAIL)\
+            .first()
+        if db_representative is None:
+            db_representative = User.objects.create_user(
+                self.REPRESENTATIVE_EMAIL,
+                self.PASSWORD
+            )
+        db_representative.is_active = True
+        db_representative.save()
+        for shop_name in (self.SHOP_NAME, self.IMPORT_SHOP_NAME):
+            db_shop, _ = Shop.objects.get_or_create(
+                name=shop_name,
+                defaults={'open': True}
+            )
+            db_shop.representatives.add(db_representative)
+        db_token, _ = Token.objects.get_or_create(user=db_representative)
+        self.representative_token = db_token.key
+
+        client = Client(self.base_url, Stats(), self.request_timeout)
+        client.token = self.representative_token
+        try:
+            client.request(
+                'setup', 'POST', '/api/user/shops/update_positions', 201,
+                files={'yaml': (
+                    'shop.yaml',
+                    get_import_file(self.SHOP_NAME, self.products_number)
+                )}
+            )
+        finally:
+            client.close()
+
+    def run(self, customers: int, representatives: int,
+            duration: float) -> float:
+        'Running journeys by virtual users, returns duration of the run'
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=self.run_user,
+                             args=(self.customer_journey, deadline))
+            for _ in range(customers)
+        ] + [
+            threading.Thread(target=self.run_user,
+                             args=(self.representative_journey, deadline))
+            for _ in range(representatives)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - start
+
+    def run_user(self, journey, deadline: float):
+        while time.monotonic() < deadline:
+            client = Client(self.base_url, self.stats, self.request_timeout)
+            try:
+                journey(client)
+            except StepError:
+                # Journey can not be continued after failed step
+                pass
+            finally:
+                client.close()
+
+    def customer_journey(self, client: Client):
+        user_email = f'load-test-{uuid.uuid4().hex}@example.com'
+        client.request('signup', 'POST', '/api/signup', 201, {
+            'email': user_email,
+            'password': self.PASSWORD,
+            'first_name': 'Иван',
+            'last_name': 'Иванов',
+            'patronymic': 'Иванович',
+            'company': 'Нагрузочный тест',
+            'position': 'Покупатель'
+        })
+
+        # Waiting for confirmation code sent by outbox
+        start = time.perf_counter()
+        confirmation_code = self.sink.wait_message(user_email,
+                                                   self.email_timeout)
+        if confirmation_code is None:
+            self.stats.add('email delivery', time.perf_counter() - start,
+                           'Timeout')
+            raise StepError('email delivery')
+        self.stats.add('email delivery', time.perf_counter() - start)
+
+        client.request('verify_email', 'POST', '/api/verify_email', 200, {
+            'email': user_email,
+            'confirmation_code': confirmation_code
+        })
+        client.token = client.request('signin', 'POST', '/api/signin', 200, {
+            'username': user_email,
+            'password': self.PASSWORD
+        })['token']
+
+        products = client.request('products', 'GET', '/api/products/', 200)
+        client.request('products search', 'GET',
+                       '/api/products/?search=lt-1', 200)
+
+        # Filling cart with positions of the load test shop
+        shop_positions_ids = [
+            shop_pos['id']
+            for product in products
+            for shop_pos in product['shops_positions']
+            if shop_pos['shop']['name'] == self.SHOP_NAME
+        ]
+        if shop_positions_ids:
+            client.request('product', 'GET',
+                           f'/api/products/{products[0]["id"]}/', 200)
+        for shop_pos_id in shop_positions_ids[:self.cart_size]:
+            client.request('cart add', 'POST', '/api/user/cart/', 201, {
+                'shop_position': shop_pos_id,
+                'quantity': 1
+            })
+        client.request('cart', 'GET', '/api/user/cart/', 200)
+
+        client.request('order', 'POST', '/api/user/orders/', 201,
+                       self.RECIPIENT_DATA)
+        client.request('orders', 'GET', '/api/user/orders/', 200)
+
+    def representative_journey(self, client: Client):
+        client.token = self.representative_token
+        client.request(
+            'import', 'POST', '/api/user/shops/update_positions', 201,
+            files={'yaml': (
+                'shop.yaml',
+                get_import_file(self.IMPORT_SHOP_NAME, self.products_number)
+            )}
+        )
+        orders = client.request('shops orders', 'GET',
+                                '/api/user/shops/orders/', 200)
+        if orders:
+            client.request('shops order', 'GET',
+                           f'/api/user/shops/orders/{orders[-1]["id"]}/',
+                           200)
@@ -0,0 +1,123 @@
+'''
+SMTP email backend with pool of open connections.
+
+Connections are not closed after sending, but returned to the pool of
+the worker process and reused by the next sends, so connecting, TLS
+handshake and authentication are done once per connection instead of
+once per send. Pooled connection is checked by NOOP before reuse and
+closed if it was idle longer than EMAIL_POOL_IDLE_TIMEOUT seconds.
+'''
+import smtplib
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+
+class SMTPConnectionPool:
+    def __init__(self, max_size: int, idle_timeout: float):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        # (connection, time of returning to the pool)
+        self.connections = deque()
+        self.lock = threading.Lock()
+
+    def get(self) -> smtplib.SMTP | None:
+        'Getting healthy connection from the pool'
+        while True:
+            with self.lock:
+                if not self.connections:
+                    return None
+                connection, returned_at = self.connections.pop()
+            if time.monotonic() - returned_at > self.idle_timeout:
+                close_connection(connection)
+                continue
+            if not is_connection_healthy(connection):
+                close_connection(connection)
+                continue
+            return connection
+
+    def put(self, connection: smtplib.SMTP):
+        'Returning connection to the pool or closing it if the pool is full'
+        with self.lock:
+            if len(self.connections) < self.max_size:
+                self.connections.append((connection, time.monotonic()))
+                return
+        close_connection(connection)
+
+
+# Pools of the process by connection parameters
+pools = dict()
+pools_lock = threading.Lock()
+
+
+def get_pool(key: tuple) -> SMTPConnectionPool:
+    with pools_lock:
+        if key not in pools:
+            pools[key] = SMTPConnectionPool(settings.EMAIL_POOL_SIZE,
+                                            settings.EMAIL_POOL_IDLE_TIMEOUT)
+        return pools[key]
+
+def is_connection_healthy(connection: smtplib.SMTP) -> bool:
+    try:
+        return connection.noop()[0] == 250
+    except OSError:
+        return False
+
+def close_connection(connection: smtplib.SMTP):
+    try:
+        connection.quit()
+    except OSError:
+        connection.close()
+
+
+class PooledEmailBackend(EmailBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = get_pool((self.host, self.port, self.username,
+                              self.use_tls, self.use_ssl))
+        self.connection_broken = False
+
+    def open(self):
+        if self.connection:
+            return False
+        self.connection = self.pool.get()
+        if self.connection:
+            self.connection_broken = False
+            return True
+        # Opening new connection
+        opened = super().open()
+        if opened:
+            self.connection_broken = False
+        return opened
+
+    def close(self):
+        'Returning connection to the pool instead of closing'
+        if self.connection is None:
+            return
+        connection = self.connection
+        self.connection = None
+        if self.connection_broken:
+            close_connection(connection)
+        else:
+            self.pool.put(connection)
+
+    def _send(self, email_message):
+        try:
+            return super()._send(email_message)
+        except smtplib.SMTPServerDisconnected:
+            self.connection_broken = True
+            raise
+        except smtplib.SMTPException:
+            # Resetting transaction of failed message on the server
+            try:
+                self.connection.rset()
+            except (smtplib.SMTPException, OSError):
+                self.connection_broken = True
+            raise
+        except OSError:
+            # Connection can not be reused
+            self.connection_broken = True
+            raise
@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.archive import archive_orders, archive_shop_positions
+
+
+class Command(BaseCommand):
+    help = ('Moves old delivered/canceled orders and unused archived'
+            ' shop positions to archive tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--age-days',
+            type=int,
+            default=settings.ORDERS_ARCHIVE_AGE_DAYS,
+            help='Minimal age of archived orders in days'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows moved in one transaction'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Repeat archiving every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            archived_orders_count = archive_orders(options['age_days'],
+                                                   options['batch_size'])
+            self.stdout.write(f'Archived orders: {archived_orders_count}')
+
+            archived_shop_positions_count =\
+                archive_shop_positions(options['batch_size'])
+            self.stdout.write(
+                f'Archived shop positions: {archived_shop_positions_count}'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
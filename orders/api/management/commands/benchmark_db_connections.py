@@ -0,0 +1,40 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ('Compares query latency with closing DB connection after every'
+            ' request (CONN_MAX_AGE=0) and with persistent connection')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Number of simulated requests for every mode'
+        )
+
+    def handle(self, *args, **options):
+        for mode in ('closing', 'persistent'):
+            latencies = []
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                if mode == 'closing':
+                    # Closing connection or returning it to the pool
+                    # like at the end of request with CONN_MAX_AGE=0
+                    connection.close()
+                latencies.append((time.perf_counter() - start) * 1000)
+            connection.close()
+
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            self.stdout.write(
+                f'{mode}: mean {statistics.mean(latencies):.3f} ms,'
+                f' p95 {p95:.3f} ms'
+            )
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (setup_databases, setup_test_environment,
+                               teardown_databases, teardown_test_environment)
+
+from api import performance
+
+
+class Command(BaseCommand):
+    help = ('Checks SQL queries budgets and latency baselines of API'
+            ' endpoints on seeded data in the test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            type=int,
+            default=max(performance.SIZES),
+            help=('Size of seeded data (numbers of shops, products,'
+                  ' positions of cart and orders), queries numbers are'
+                  f' compared with size {min(performance.SIZES)}')
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of requests to every endpoint'
+        )
+        parser.add_argument(
+            '--factor',
+            type=float,
+            default=1.5,
+            help='Allowed ratio of latency to its baseline'
+        )
+        parser.add_argument(
+            '--baselines',
+            default=settings.BASE_DIR / 'performance_baselines.json',
+            type=Path,
+            help='JSON file of latency baselines in milliseconds'
+        )
+        parser.add_argument(
+            '--record',
+            action='store_true',
+            help='Recording latency baselines instead of checking'
+        )
+
+    def handle(self, *args, **options):
+        # Creating test databases like test runner does
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        sizes = sorted({min(performance.SIZES), options['size']})
+        try:
+            results_by_sizes = {
+                size: performance.check_endpoints(size, options['repeat'])
+                for size in sizes
+            }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for size, results in results_by_sizes.items():
+            for name, result in results.items():
+                self.stdout.write(
+                    f'{name} (size {size}): {result["queries"]} queries,'
+                    f' {result["latency"]:.1f} ms'
+                )
+        results = results_by_sizes[options['size']]
+
+        if options['record']:
+            performance.save_baselines(options['baselines'], results)
+            self.stdout.write(f'Baselines saved to {options["baselines"]}')
+            baselines = dict()
+        else:
+            baselines = performance.load_baselines(options['baselines'])
+            if not baselines:
+                self.stdout.write('No latency baselines, checking queries')
+
+        errors = performance.get_errors(results_by_sizes, baselines,
+                                        options['factor'])
+        if errors:
+            raise CommandError('\n'.join(errors))
+        self.stdout.write('All endpoints are within budgets')
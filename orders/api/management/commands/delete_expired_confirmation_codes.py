@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.confirmation_codes import DBConfirmationCodeStore
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired confirmation codes from DB'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Repeat deleting every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            deleted_codes_count, _ =\
+                DBConfirmationCodeStore().get_expired().delete()
+            self.stdout.write(
+                f'Deleted confirmation codes: {deleted_codes_count}'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired idempotency keys with stored responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Repeat deleting every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            deleted_keys_count, _ = IdempotencyKey.objects\
+                .filter(expires_at__lte=timezone.now())\
+                .delete()
+            self.stdout.write(f'Deleted idempotency keys: {deleted_keys_count}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.forms.models import model_to_dict
+
+from api.models import Recipient, UserRecipient
+
+
+class Command(BaseCommand):
+    help = ('Fills users address books with recipients of orders'
+            ' created before address books were added')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of recipients processed in one transaction'
+        )
+
+    def handle(self, *args, **options):
+        processed_recipients_count = 0
+        last_order_id = 0
+        while True:
+            with transaction.atomic():
+                db_recipients = list(
+                    Recipient.objects
+                        .filter(order__gt=last_order_id)
+                        .select_related('order__user', 'address')
+                        .order_by('order')[:options['batch_size']]
+                )
+                if not db_recipients:
+                    break
+
+                for db_recipient in db_recipients:
+                    UserRecipient.objects.save_recipient(
+                        db_recipient.order.user,
+                        model_to_dict(db_recipient),
+                        model_to_dict(db_recipient.address),
+                        used_at=db_recipient.order.created_at
+                    )
+            processed_recipients_count += len(db_recipients)
+            last_order_id = db_recipients[-1].order_id
+
+        self.stdout.write(f'Processed recipients: {processed_recipients_count}')
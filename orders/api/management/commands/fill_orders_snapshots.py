@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Order, OrderPosition
+
+
+class Command(BaseCommand):
+    help = ('Fills shop positions data and totals of orders'
+            ' created before they were saved at the time of ordering')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of orders processed in one transaction'
+        )
+
+    def handle(self, *args, **options):
+        filled_orders_count = 0
+        while True:
+            with transaction.atomic():
+                db_orders = list(
+                    Order.objects
+                        .filter(total_sum=None)
+                        .prefetch_related(
+                            'positions__shop_position__shop',
+                            'positions__shop_position__product'
+                        )[:options['batch_size']]
+                )
+                if not db_orders:
+                    break
+
+                db_order_positions = []
+                for db_order in db_orders:
+                    for db_order_pos in db_order.positions.all():
+                        db_order_pos.fill_snapshot(db_order_pos.shop_position)
+                        db_order_positions.append(db_order_pos)
+                    db_order.total_quantity = sum(
+                        p.quantity for p in db_order.positions.all()
+                    )
+                    db_order.total_sum = sum(
+                        (p.sum for p in db_order.positions.all()),
+                        Decimal(0)
+                    )
+                OrderPosition.objects.bulk_update(
+                    db_order_positions,
+                    ['shop', 'shop_name', 'product_name', 'product_model',
+                     'price', 'sum']
+                )
+                Order.objects.bulk_update(db_orders,
+                                          ['total_quantity', 'total_sum'])
+            filled_orders_count += len(db_orders)
+
+        self.stdout.write(f'Filled orders: {filled_orders_count}')
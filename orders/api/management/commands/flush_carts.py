@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cart_store import CacheCartStore, get_cart_store
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Writes users carts changed in the cache to DB'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Repeat flushing every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        cart_store = get_cart_store()
+        if not isinstance(cart_store, CacheCartStore):
+            raise CommandError(
+                f'Carts are not stored in the cache'
+                f' (CART_STORAGE={settings.CART_STORAGE!r}).'
+            )
+
+        while True:
+            flushed_carts_count = self.flush_carts(cart_store)
+            self.stdout.write(f'Flushed carts: {flushed_carts_count}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def flush_carts(self, cart_store: CacheCartStore) -> int:
+        users_ids = cart_store.pop_dirty_users_ids()
+        for user in User.objects.filter(pk__in=users_ids):
+            cart_store.flush(user)
+        return len(users_ids)
@@ -0,0 +1,154 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+from django.test.utils import override_settings
+
+from api.load_testing import LoadTest, SMTPSink
+from api.outbox import send_due_emails
+
+
+class Command(BaseCommand):
+    help = ('Runs customers and shop representatives journeys against'
+            ' the running application and reports latency and errors'
+            ' of every step')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='Base URL of the application'
+        )
+        parser.add_argument(
+            '--customers',
+            type=int,
+            default=10,
+            help='Number of concurrent customers'
+        )
+        parser.add_argument(
+            '--representatives',
+            type=int,
+            default=1,
+            help='Number of concurrent shop representatives'
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=60,
+            help='Duration of the test in seconds'
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100,
+            help='Number of products in imported shops'
+        )
+        parser.add_argument(
+            '--cart-size',
+            type=int,
+            default=3,
+            help='Number of cart positions of every order'
+        )
+        parser.add_argument(
+            '--smtp-host',
+            default='127.0.0.1',
+            help='Address of the SMTP sink catching confirmation codes'
+        )
+        parser.add_argument(
+            '--smtp-port',
+            type=int,
+            default=1025,
+            help='Port of the SMTP sink'
+        )
+        parser.add_argument(
+            '--no-outbox',
+            action='store_true',
+            help=('Not sending outbox emails to the SMTP sink by this'
+                  ' command (outbox worker of the application sends them)')
+        )
+        parser.add_argument(
+            '--email-timeout',
+            type=float,
+            default=30,
+            help='Time of waiting for confirmation code in seconds'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Timeout of requests in seconds'
+        )
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['smtp_host'], options['smtp_port'])
+        sink.start()
+        load_test = LoadTest(
+            options['url'],
+            sink,
+            options['products'],
+            options['cart_size'],
+            options['email_timeout'],
+            options['timeout']
+        )
+        stop_outbox = threading.Event()
+        outbox_thread = threading.Thread(
+            target=self.send_outbox_emails,
+            args=(options['smtp_host'], options['smtp_port'], stop_outbox)
+        )
+        try:
+            load_test.setup()
+            if not options['no_outbox']:
+                outbox_thread.start()
+            duration = load_test.run(options['customers'],
+                                     options['representatives'],
+                                     options['duration'])
+        finally:
+            stop_outbox.set()
+            if outbox_thread.is_alive():
+                outbox_thread.join()
+            sink.stop()
+
+        self.stdout.write(
+            f'{"step":<16}{"requests":>10}{"req/s":>10}{"p50 ms":>10}'
+            f'{"p95 ms":>10}{"p99 ms":>10}{"errors":>10}'
+        )
+        report = load_test.stats.get_report(duration)
+        for step in report:
+            self.stdout.write(
+                f'{step["step"]:<16}{step["requests"]:>10}'
+                f'{step["throughput"]:>10.1f}{step["p50"] * 1000:>10.1f}'
+                f'{step["p95"] * 1000:>10.1f}{step["p99"] * 1000:>10.1f}'
+                f'{step["error_rate"]:>10.1%}'
+            )
+        for step in report:
+            for error, count in step['errors'].items():
+                self.stdout.write(f'{step["step"]}: {error} x {count}')
+
+    def send_outbox_emails(self, smtp_host: str, smtp_port: int,
+                           stop: threading.Event):
+        'Sending outbox emails to the SMTP sink until stop'
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST=smtp_host,
+            EMAIL_PORT=smtp_port,
+            EMAIL_USE_SSL=False,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            DEFAULT_FROM_EMAIL=(settings.DEFAULT_FROM_EMAIL
+                                or 'load-test@example.com')
+        ):
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    try:
+                        sent_count, failed_count = send_due_emails(100)
+                    except DatabaseError as e:
+                        # Retrying after busy database
+                        self.stderr.write(f'Sending outbox emails: {e}')
+                        sent_count, failed_count = 0, 0
+                    if not sent_count + failed_count:
+                        stop.wait(0.1)
+            finally:
+                connections.close_all()
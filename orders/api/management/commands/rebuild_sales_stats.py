@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from api.models import ShopSalesDay
+
+
+class Command(BaseCommand):
+    help = 'Recalculates daily sales stats of shops from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            type=date.fromisoformat,
+            help='First day of the period (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            type=date.fromisoformat,
+            help='Last day of the period (YYYY-MM-DD)'
+        )
+
+    def handle(self, *args, **options):
+        created_stats_count = ShopSalesDay.objects.rebuild(
+            date_from=options['date_from'],
+            date_to=options['date_to']
+        )
+        self.stdout.write(f'Created daily stats: {created_stats_count}')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import StockHold
+
+
+class Command(BaseCommand):
+    help = 'Returns quantity of expired stock holds to shop positions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Repeat releasing every INTERVAL seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released_holds_count = StockHold.objects.expired().release()
+            self.stdout.write(f'Released stock holds: {released_holds_count}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.outbox import enqueue_admin_orders_digest
+
+
+class Command(BaseCommand):
+    help = ('Adds digest email to admins about new orders to outbox'
+            ' every ADMIN_ORDERS_DIGEST_INTERVAL seconds (once if it is 0)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Add digest once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            orders_count = enqueue_admin_orders_digest()
+            self.stdout.write(f'Orders in digest: {orders_count}')
+            if options['once'] or not settings.ADMIN_ORDERS_DIGEST_INTERVAL:
+                break
+            time.sleep(settings.ADMIN_ORDERS_DIGEST_INTERVAL)
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import send_due_emails
+
+
+class Command(BaseCommand):
+    help = 'Sends due emails from outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Repeat sending every INTERVAL seconds'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of emails sent over one connection'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Sending batches until there are no due emails
+            while True:
+                sent_count, failed_count =\
+                    send_due_emails(options['batch_size'])
+                if sent_count or failed_count:
+                    self.stdout.write(f'Sent emails: {sent_count},'
+                                      f' failed: {failed_count}')
+                if sent_count + failed_count < options['batch_size']:
+                    break
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,189 @@
+'''
+Performance metrics of requests in Prometheus text format.
+
+MetricsMiddleware records for every route latency of requests, number
+and time of SQL queries, time of rendering response data and size of
+response. Phases of imports and orders placement are timed by
+phase_timer. Metrics are aggregated in each process without sharing
+state with other processes. If PROMETHEUS_MULTIPROC_DIR is set
+(gunicorn.conf.py sets it), processes write metrics to files of this
+directory and "/metrics" endpoint sums metrics of all processes.
+The endpoint requires METRICS_TOKEN, without it the endpoint is
+available only if DEBUG is set.
+'''
+import hmac
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Histogram, generate_latest,
+                               multiprocess)
+from rest_framework.renderers import JSONRenderer
+
+
+REQUEST_DURATION = Histogram(
+    'orders_http_request_duration_seconds',
+    'Duration of requests',
+    ['route', 'method', 'status']
+)
+REQUEST_DB_QUERIES = Histogram(
+    'orders_http_request_db_queries',
+    'Number of SQL queries of requests',
+    ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+REQUEST_DB_DURATION = Histogram(
+    'orders_http_request_db_duration_seconds',
+    'Duration of SQL queries of requests',
+    ['route']
+)
+RESPONSE_SERIALIZATION_DURATION = Histogram(
+    'orders_http_response_serialization_seconds',
+    'Duration of rendering response data',
+    ['route']
+)
+RESPONSE_SIZE = Histogram(
+    'orders_http_response_size_bytes',
+    'Size of responses content',
+    ['route'],
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000)
+)
+PHASE_DURATION = Histogram(
+    'orders_phase_duration_seconds',
+    'Duration of phases of operations',
+    ['operation', 'phase']
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.db_queries = 0
+        self.db_duration = 0.0
+        self.serialization_duration = 0.0
+
+
+# Stats of the current request, views run in other threads get
+# the same object with the context
+request_stats = ContextVar('request_stats', default=None)
+
+
+@receiver(connection_created)
+def add_queries_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+def count_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_duration += time.perf_counter() - start
+
+
+@contextmanager
+def phase_timer(operation: str, phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_DURATION.labels(operation, phase)\
+            .observe(time.perf_counter() - start)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        finally:
+            stats = request_stats.get()
+            if stats is not None:
+                stats.serialization_duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        record_request(request, response, stats,
+                       time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        record_request(request, response, stats,
+                       time.perf_counter() - start)
+        return response
+
+
+def get_route(request) -> str:
+    if request.resolver_match is None:
+        return 'unmatched'
+    return request.resolver_match.route
+
+def record_request(request, response, stats: RequestStats, duration: float):
+    route = get_route(request)
+    if route == 'metrics':
+        return
+    REQUEST_DURATION.labels(route, request.method, response.status_code)\
+        .observe(duration)
+    REQUEST_DB_QUERIES.labels(route).observe(stats.db_queries)
+    REQUEST_DB_DURATION.labels(route).observe(stats.db_duration)
+    RESPONSE_SERIALIZATION_DURATION.labels(route)\
+        .observe(stats.serialization_duration)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(route).observe(len(response.content))
+
+
+def metrics_view(request):
+    # Without token metrics are available only in debug mode
+    if settings.METRICS_TOKEN:
+        if not hmac.compare_digest(
+            request.headers.get('Authorization', ''),
+            f'Bearer {settings.METRICS_TOKEN}'
+        ):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # Summing metrics of all processes
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry),
+                        content_type=CONTENT_TYPE_LATEST)
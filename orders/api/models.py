@@ -1,10 +1,21 @@
+import hashlib
+import json
 import random
 import string
-from django.db import models
+from decimal import Decimal
+from itertools import chain
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
 from rest_framework.fields import MinValueValidator
 
 
+# Output field for sums of positions prices
+SUM_FIELD = models.DecimalField(max_digits=28, decimal_places=2)
+
+
 class UserManager(BaseUserManager):
     def create_user(self, email: str, password: str):
         '''
@@ -115,10 +126,14 @@ class ConfirmationCode(models.Model):
         related_name='confirmation_code'
     )
     value = models.CharField(max_length=LENGTH, verbose_name='значение')
-    created_at = models.DateTimeField(auto_now_add=True,
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True,
                                       verbose_name='создан')
     sent_at = models.DateTimeField(null=True,
                                    verbose_name='отправлен')
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='неверные попытки ввода'
+    )
     
     @classmethod
     def generate(cls):
@@ -126,6 +141,59 @@ class ConfirmationCode(models.Model):
         return code
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_positions(self):
+        'Getting orders with recipients, addresses and positions'
+        return self\
+            .select_related('recipient__address')\
+            .prefetch_related('positions')
+
+    def change_status(self, new_status: str) -> list:
+        '''
+        Changing status of orders by one UPDATE if transition
+        to new status is allowed. Returns ids of changed orders.
+        '''
+        with transaction.atomic():
+            db_orders_statuses = dict(
+                self
+                    .filter(status__in=Order.get_previous_statuses(new_status))
+                    .select_for_update()
+                    .values_list('pk', 'status')
+            )
+            if not db_orders_statuses:
+                return []
+            db_orders_ids = list(db_orders_statuses)
+
+            changed_fields = {'status': new_status}
+            if new_status == Order.StatusChoices.DELIVERED:
+                changed_fields['delivired_at'] = timezone.now()
+            Order.objects.filter(pk__in=db_orders_ids).update(**changed_fields)
+
+            # Returning quantity of canceled orders to shop positions
+            if new_status == Order.StatusChoices.CANCELED:
+                quantities = dict(
+                    OrderPosition.objects
+                        .filter(order__in=db_orders_ids,
+                                shop_position__archived_at=None)
+                        .order_by()
+                        .values('shop_position')
+                        .annotate(quantity=models.Sum('quantity'))
+                        .values_list('shop_position', 'quantity')
+                )
+                ShopPosition.objects.unreserve(quantities)
+                # Subtracting sales only of orders counted in stats
+                counted_orders_ids = [
+                    order_id
+                    for order_id, status in db_orders_statuses.items()
+                    if status not in ShopSalesDay.EXCLUDED_ORDER_STATUSES
+                ]
+                if counted_orders_ids:
+                    ShopSalesDay.objects.add_orders(counted_orders_ids,
+                                                    sign=-1)
+
+        return db_orders_ids
+
+
 class Order(models.Model):
     class Meta:
         verbose_name = 'заказ'
@@ -140,6 +208,18 @@ class Order(models.Model):
         DELIVERED = ('DELIVERED', 'Доставлен')
         CANCELED = ('CANCELED', 'Отменён')
 
+    # Allowed transitions {status: next statuses}
+    STATUS_TRANSITIONS = {
+        StatusChoices.FORMATION: [StatusChoices.NEW, StatusChoices.CANCELED],
+        StatusChoices.NEW: [StatusChoices.CONFIRMED, StatusChoices.CANCELED],
+        StatusChoices.CONFIRMED: [StatusChoices.ASSEMBLED,
+                                  StatusChoices.CANCELED],
+        StatusChoices.ASSEMBLED: [StatusChoices.SENT, StatusChoices.CANCELED],
+        StatusChoices.SENT: [StatusChoices.DELIVERED, StatusChoices.CANCELED],
+        StatusChoices.DELIVERED: [],
+        StatusChoices.CANCELED: [],
+    }
+
     created_at = models.DateTimeField(auto_now_add=True,
                                       verbose_name='создан')
     delivired_at = models.DateTimeField(verbose_name='доставлен', null=True,
@@ -157,10 +237,34 @@ class Order(models.Model):
         related_name='orders',
         verbose_name='пользователь'
     )
+    total_quantity = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='общее количество'
+    )
+    total_sum = models.DecimalField(
+        max_digits=28,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name='общая сумма'
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return f'№{self.pk} (id={self.pk})'
 
+    @classmethod
+    def get_previous_statuses(cls, status: str) -> list:
+        'Statuses from which transition to the status is allowed'
+        return [
+            previous_status
+            for previous_status, next_statuses
+            in cls.STATUS_TRANSITIONS.items()
+            if status in next_statuses
+        ]
+
 
 class Recipient(models.Model):
     class Meta:
@@ -207,6 +311,82 @@ class Address(models.Model):
     )
 
 
+class UserRecipientQuerySet(models.QuerySet):
+    def save_recipient(self, user, recipient_data: dict,
+                       address_data: dict, used_at=None) -> 'UserRecipient':
+        'Adding recipient to user address book or updating its using time'
+        fields = {
+            **{f: recipient_data[f] for f in UserRecipient.RECIPIENT_FIELDS},
+            **{f: address_data[f] for f in UserRecipient.ADDRESS_FIELDS}
+        }
+        used_at = used_at or timezone.now()
+        db_user_recipient, created = self.get_or_create(
+            user=user,
+            content_hash=UserRecipient.get_content_hash(fields),
+            defaults={**fields, 'last_used_at': used_at}
+        )
+        if not created and db_user_recipient.last_used_at < used_at:
+            db_user_recipient.last_used_at = used_at
+            db_user_recipient.save(update_fields=['last_used_at'])
+        return db_user_recipient
+
+
+class UserRecipient(models.Model):
+    'Unique recipient with address of user orders'
+    class Meta:
+        verbose_name = 'получатель из адресной книги'
+        verbose_name_plural = 'адресная книга'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'content_hash'],
+                name='unique_user_recipient'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_used_at'],
+                         name='user_recipient_last_used')
+        ]
+
+    RECIPIENT_FIELDS = ['first_name', 'last_name', 'patronymic', 'email',
+                        'phone']
+    ADDRESS_FIELDS = ['city', 'street', 'house_number', 'house_block',
+                      'house_building', 'appartment']
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recipients',
+        verbose_name='пользователь'
+    )
+    # Hash of recipient and address fields values
+    content_hash = models.CharField(max_length=64, verbose_name='хэш')
+    first_name = models.CharField(max_length=30, verbose_name='имя')
+    last_name = models.CharField(max_length=30, verbose_name='фамилия')
+    patronymic = models.CharField(max_length=30, verbose_name='отчество')
+    email = models.EmailField(max_length=50, verbose_name='эл. почта')
+    phone = models.CharField(max_length=20, verbose_name='телефон')
+    city = models.CharField(max_length=50, verbose_name='город')
+    street = models.CharField(max_length=50, verbose_name='улица')
+    house_number = models.CharField(max_length=10, verbose_name='дом')
+    house_block = models.CharField(max_length=10, verbose_name='корпус')
+    house_building = models.CharField(max_length=10, verbose_name='строение')
+    appartment = models.CharField(max_length=10, verbose_name='квартира')
+    last_used_at = models.DateTimeField(verbose_name='последнее использование')
+
+    objects = UserRecipientQuerySet.as_manager()
+
+    def __str__(self):
+        return (f'{self.last_name} {self.first_name} {self.patronymic}'
+                f' (id={self.pk})')
+
+    @classmethod
+    def get_content_hash(cls, fields: dict) -> str:
+        content = json.dumps(
+            [fields[f] for f in cls.RECIPIENT_FIELDS + cls.ADDRESS_FIELDS]
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+
 class ParameterName(models.Model):
     class Meta:
         verbose_name = 'название параметра'
@@ -298,6 +478,33 @@ class ProductParameter(models.Model):
     value = models.CharField(max_length=50, verbose_name='значение')
 
 
+class ShopPositionQuerySet(models.QuerySet):
+    def reserve(self, quantities: dict) -> bool:
+        '''
+        Subtracting quantities ({shop position id: quantity}) from not
+        archived shop positions having enough quantity by one statement.
+        Returns False if not all shop positions were reserved, so the
+        caller has to roll back the transaction.
+        '''
+        if not quantities:
+            return True
+        reservation_quantity = get_quantities_case(quantities)
+        reserved_shop_positions_count = self\
+            .filter(pk__in=quantities.keys(),
+                    archived_at=None,
+                    quantity__gte=reservation_quantity)\
+            .update(quantity=models.F('quantity') - reservation_quantity)
+        return reserved_shop_positions_count == len(quantities)
+
+    def unreserve(self, quantities: dict):
+        'Adding quantities ({shop position id: quantity}) to shop positions'
+        if not quantities:
+            return
+        self.filter(pk__in=quantities.keys()).update(
+            quantity=models.F('quantity') + get_quantities_case(quantities)
+        )
+
+
 class ShopPosition(models.Model):
     class Meta:
         verbose_name = 'позиция в магазине'
@@ -339,10 +546,129 @@ class ShopPosition(models.Model):
     archived_at = models.DateTimeField(verbose_name='архивирован', null=True,
                                        blank=True)
 
+    objects = ShopPositionQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.product.name}, {self.shop.name} (id={self.pk})'
 
 
+class StockHoldQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def get_user_quantities(self, user) -> dict:
+        '''
+        Returns quantities held for user by shop positions ids. Expired
+        holds are included until they are released, their quantity
+        is not returned to shop positions yet.
+        '''
+        return dict(
+            self.filter(user=user).values_list('shop_position', 'quantity')
+        )
+
+    def release(self) -> int:
+        'Returning held quantity to shop positions and deleting holds'
+        with transaction.atomic():
+            db_holds = list(
+                self.select_for_update().order_by('shop_position_id')
+            )
+            quantities = dict()
+            for db_hold in db_holds:
+                quantities[db_hold.shop_position_id] =\
+                    quantities.get(db_hold.shop_position_id, 0)\
+                    + db_hold.quantity
+            ShopPosition.objects.unreserve(quantities)
+            StockHold.objects\
+                .filter(pk__in=[db_hold.pk for db_hold in db_holds])\
+                .delete()
+        return len(db_holds)
+
+
+class StockHold(models.Model):
+    class Meta:
+        verbose_name = 'удержание позиции магазина'
+        verbose_name_plural = 'удержания позиций магазина'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'shop_position'],
+                name='unique_user_stock_hold_shop_position'
+            )
+        ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stock_holds',
+        verbose_name='пользователь'
+    )
+    shop_position = models.ForeignKey(
+        ShopPosition,
+        on_delete=models.CASCADE,
+        related_name='stock_holds',
+        verbose_name='позиция в магазине'
+    )
+    quantity = models.PositiveIntegerField(verbose_name='количество')
+    expires_at = models.DateTimeField(verbose_name='истекает',
+                                      db_index=True)
+
+    objects = StockHoldQuerySet.as_manager()
+
+
+class CartPositionQuerySet(models.QuerySet):
+    def with_sums(self):
+        'Annotating cart positions with their sums'
+        return self.annotate(sum=get_position_sum_expression())
+
+    def get_totals(self) -> dict:
+        'Calculating total quantity and total sum of cart positions'
+        return self.with_sums().aggregate(
+            total_quantity=Coalesce(models.Sum('quantity'), 0),
+            total_sum=Coalesce(
+                models.Sum('sum'),
+                models.Value(Decimal(0)),
+                output_field=SUM_FIELD
+            )
+        )
+
+    def get_state(self, user) -> dict:
+        'Getting user cart state as {shop position id: quantity}'
+        return dict(
+            self.filter(user=user).values_list('shop_position', 'quantity')
+        )
+
+    def save_state(self, user, cart_state: dict):
+        'Saving user cart state ({shop position id: quantity}) to DB'
+        db_cart_positions = {
+            db_cart_pos.shop_position_id: db_cart_pos
+            for db_cart_pos in self.filter(user=user)
+        }
+        cart_positions_to_create = []
+        cart_positions_to_update = []
+        for shop_pos_id, cart_pos_qnt in cart_state.items():
+            db_cart_pos = db_cart_positions.get(shop_pos_id)
+            if db_cart_pos is None:
+                cart_positions_to_create.append(CartPosition(
+                    user=user,
+                    shop_position_id=shop_pos_id,
+                    quantity=cart_pos_qnt
+                ))
+            elif cart_pos_qnt != db_cart_pos.quantity:
+                db_cart_pos.quantity = cart_pos_qnt
+                cart_positions_to_update.append(db_cart_pos)
+        cart_positions_to_delete = [
+            db_cart_pos.pk
+            for shop_pos_id, db_cart_pos in db_cart_positions.items()
+            if shop_pos_id not in cart_state
+        ]
+        with transaction.atomic():
+            self.bulk_create(cart_positions_to_create)
+            self.bulk_update(cart_positions_to_update, ['quantity'])
+            self.filter(pk__in=cart_positions_to_delete).delete()
+
+
 class CartPosition(models.Model):
     class Meta:
         verbose_name = 'позиция в корзине'
@@ -369,6 +695,8 @@ class CartPosition(models.Model):
     )
     quantity = models.PositiveIntegerField(verbose_name='количество')
 
+    objects = CartPositionQuerySet.as_manager()
+
 
 class OrderPosition(models.Model):
     class Meta:
@@ -395,6 +723,490 @@ class OrderPosition(models.Model):
     )
     quantity = models.PositiveIntegerField(verbose_name='количество')
 
+    # Shop position data at the time of ordering
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='orders_positions',
+        verbose_name='магазин'
+    )
+    shop_name = models.CharField(max_length=40, null=True,
+                                 verbose_name='название магазина')
+    product_name = models.CharField(max_length=80, null=True,
+                                    verbose_name='название товара')
+    product_model = models.CharField(max_length=40, null=True,
+                                     verbose_name='модель товара')
+    price = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        null=True,
+        verbose_name='цена'
+    )
+    sum = models.DecimalField(
+        max_digits=28,
+        decimal_places=2,
+        null=True,
+        verbose_name='сумма'
+    )
+
+    def fill_snapshot(self, shop_position: ShopPosition):
+        'Saving shop position data at the time of ordering'
+        self.shop_position = shop_position
+        self.shop = shop_position.shop
+        self.shop_name = shop_position.shop.name
+        self.product_name = shop_position.product.name
+        self.product_model = shop_position.product.model
+        self.price = shop_position.price
+        self.sum = shop_position.price * self.quantity
+
+
+class ShopSalesDayQuerySet(models.QuerySet):
+    def get_orders_sales(self, db_orders_positions) -> list[dict]:
+        'Aggregating sales by day, shop and product from order positions'
+        return db_orders_positions\
+            .filter(shop__isnull=False)\
+            .order_by()\
+            .values(
+                'shop',
+                day=TruncDate('order__created_at'),
+                product=models.F('shop_position__product'),
+                category=models.F('shop_position__product__category')
+            )\
+            .annotate(
+                sold_quantity=models.Sum('quantity'),
+                revenue=models.Sum('sum')
+            )
+
+    def get_archived_orders_sales(self,
+                                  db_archived_orders_positions) -> list[dict]:
+        'Aggregating sales by day, shop and product from archived positions'
+        return db_archived_orders_positions\
+            .filter(shop__isnull=False, product__isnull=False)\
+            .order_by()\
+            .values(
+                'shop',
+                'product',
+                'category',
+                day=TruncDate('order__created_at')
+            )\
+            .annotate(
+                sold_quantity=models.Sum('quantity'),
+                revenue=models.Sum('sum')
+            )
+
+    # Number of stats rows changed by one UPDATE
+    ADD_ORDERS_BATCH_SIZE = 500
+
+    def add_orders(self, orders_ids, sign: int = 1):
+        '''
+        Adding sales of orders to daily stats (sign=1)
+        or subtracting them (sign=-1). Number of queries does not depend
+        on number of orders positions: missing stats rows are created
+        by one INSERT, all rows are changed by one UPDATE.
+        '''
+        db_orders_positions =\
+            OrderPosition.objects.filter(order__in=orders_ids)
+        sales_list = list(self.get_orders_sales(db_orders_positions))
+        with transaction.atomic():
+            for i in range(0, len(sales_list), self.ADD_ORDERS_BATCH_SIZE):
+                self._add_sales(
+                    sales_list[i:i + self.ADD_ORDERS_BATCH_SIZE],
+                    sign
+                )
+
+    def _add_sales(self, sales_list: list[dict], sign: int):
+        # Creating missing stats rows, rows created by concurrent
+        # transactions are skipped
+        self.bulk_create(
+            [
+                ShopSalesDay(
+                    day=sales['day'],
+                    shop_id=sales['shop'],
+                    product_id=sales['product'],
+                    category_id=sales['category'],
+                    quantity=0,
+                    revenue=0
+                )
+                for sales in sales_list
+            ],
+            ignore_conflicts=True
+        )
+
+        # Changing stats rows by one UPDATE
+        keys_condition = models.Q()
+        quantity_changes = []
+        revenue_changes = []
+        for sales in sales_list:
+            key = models.Q(day=sales['day'], shop_id=sales['shop'],
+                           product_id=sales['product'])
+            keys_condition |= key
+            quantity_changes.append(models.When(
+                key, then=models.Value(sign * sales['sold_quantity'])
+            ))
+            revenue_changes.append(models.When(
+                key, then=models.Value(sign * sales['revenue'])
+            ))
+        self.filter(keys_condition).update(
+            quantity=models.F('quantity') + models.Case(
+                *quantity_changes,
+                default=models.Value(0),
+                output_field=models.IntegerField()
+            ),
+            revenue=models.F('revenue') + models.Case(
+                *revenue_changes,
+                default=models.Value(Decimal(0)),
+                output_field=SUM_FIELD
+            )
+        )
+
+    def rebuild(self, date_from=None, date_to=None) -> int:
+        '''
+        Recalculating daily stats for the period from orders
+        and archived orders
+        '''
+        db_stats = self.all()
+        db_orders_positions = OrderPosition.objects.exclude(
+            order__status__in=ShopSalesDay.EXCLUDED_ORDER_STATUSES
+        )
+        db_archived_orders_positions = ArchivedOrderPosition.objects.exclude(
+            order__status__in=ShopSalesDay.EXCLUDED_ORDER_STATUSES
+        )
+        if date_from:
+            db_stats = db_stats.filter(day__gte=date_from)
+            db_orders_positions = db_orders_positions\
+                .filter(order__created_at__date__gte=date_from)
+            db_archived_orders_positions = db_archived_orders_positions\
+                .filter(order__created_at__date__gte=date_from)
+        if date_to:
+            db_stats = db_stats.filter(day__lte=date_to)
+            db_orders_positions = db_orders_positions\
+                .filter(order__created_at__date__lte=date_to)
+            db_archived_orders_positions = db_archived_orders_positions\
+                .filter(order__created_at__date__lte=date_to)
+
+        with transaction.atomic():
+            # Summing sales of days split between orders and archived orders
+            stats = {}
+            for sales in chain(
+                self.get_orders_sales(db_orders_positions).iterator(),
+                self.get_archived_orders_sales(db_archived_orders_positions)
+                    .iterator()
+            ):
+                key = (sales['day'], sales['shop'], sales['product'])
+                if key in stats:
+                    stats[key].quantity += sales['sold_quantity']
+                    stats[key].revenue += sales['revenue']
+                else:
+                    stats[key] = ShopSalesDay(
+                        day=sales['day'],
+                        shop_id=sales['shop'],
+                        product_id=sales['product'],
+                        category_id=sales['category'],
+                        quantity=sales['sold_quantity'],
+                        revenue=sales['revenue']
+                    )
+
+            db_stats.delete()
+            created_stats = self.bulk_create(stats.values(),
+                                             batch_size=1000)
+        return len(created_stats)
+
+
+class ShopSalesDay(models.Model):
+    class Meta:
+        verbose_name = 'продажи магазина за день'
+        verbose_name_plural = 'продажи магазинов по дням'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shop', 'day', 'product'],
+                name='unique_shop_sales_day_product'
+            )
+        ]
+
+    # Sales of orders with these statuses are not counted
+    EXCLUDED_ORDER_STATUSES = [Order.StatusChoices.FORMATION,
+                               Order.StatusChoices.CANCELED]
+
+    day = models.DateField(verbose_name='день')
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        related_name='sales_days',
+        verbose_name='магазин'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='sales_days',
+        verbose_name='товар'
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='sales_days',
+        verbose_name='категория'
+    )
+    quantity = models.IntegerField(verbose_name='количество')
+    revenue = models.DecimalField(max_digits=28, decimal_places=2,
+                                  verbose_name='выручка')
+
+    objects = ShopSalesDayQuerySet.as_manager()
+
+
+class ArchivedOrder(models.Model):
+    'Delivered or canceled order moved from Order table'
+    class Meta:
+        verbose_name = 'архивный заказ'
+        verbose_name_plural = 'архивные заказы'
+
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField(verbose_name='создан', db_index=True)
+    delivired_at = models.DateTimeField(verbose_name='доставлен', null=True,
+                                        blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=Order.StatusChoices.choices,
+        verbose_name='статус'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_orders',
+        verbose_name='пользователь'
+    )
+    total_quantity = models.PositiveIntegerField(
+        null=True,
+        verbose_name='общее количество'
+    )
+    total_sum = models.DecimalField(
+        max_digits=28,
+        decimal_places=2,
+        null=True,
+        verbose_name='общая сумма'
+    )
+    # Recipient with address
+    recipient = models.JSONField(null=True, verbose_name='получатель заказа')
+
+    def __str__(self):
+        return f'№{self.pk} (id={self.pk})'
+
+
+class ArchivedOrderPosition(models.Model):
+    'Position of order moved from OrderPosition table'
+    class Meta:
+        verbose_name = 'позиция в архивном заказе'
+        verbose_name_plural = 'позиции в архивном заказе'
+
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='positions',
+        verbose_name='заказ'
+    )
+    # Shop position can be moved to archive or deleted
+    shop_position = models.BigIntegerField(verbose_name='позиция в магазине')
+    quantity = models.PositiveIntegerField(verbose_name='количество')
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='archived_orders_positions',
+        verbose_name='магазин'
+    )
+    # Product and category of shop position for rebuilding sales stats
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='archived_orders_positions',
+        verbose_name='товар'
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='archived_orders_positions',
+        verbose_name='категория'
+    )
+    shop_name = models.CharField(max_length=40, null=True,
+                                 verbose_name='название магазина')
+    product_name = models.CharField(max_length=80, null=True,
+                                    verbose_name='название товара')
+    product_model = models.CharField(max_length=40, null=True,
+                                     verbose_name='модель товара')
+    price = models.DecimalField(max_digits=18, decimal_places=2, null=True,
+                                verbose_name='цена')
+    sum = models.DecimalField(max_digits=28, decimal_places=2, null=True,
+                              verbose_name='сумма')
+
+
+class ArchivedShopPosition(models.Model):
+    'Archived shop position not used in orders and carts'
+    class Meta:
+        verbose_name = 'позиция в магазине из архива'
+        verbose_name_plural = 'позиции в магазине из архива'
+
+    id = models.BigIntegerField(primary_key=True)
+    shop = models.ForeignKey(
+        Shop,
+        on_delete=models.CASCADE,
+        related_name='archived_positions',
+        verbose_name='магазин'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='archived_shops_positions',
+        verbose_name='товар'
+    )
+    external_id = models.PositiveIntegerField(verbose_name='внешний ID')
+    price = models.DecimalField(max_digits=18, decimal_places=2,
+                                verbose_name='цена')
+    price_rrc = models.DecimalField(
+        max_digits=18,
+        decimal_places=2,
+        verbose_name='рекомендуемая розничная цена',
+        null=True
+    )
+    archived_at = models.DateTimeField(verbose_name='архивирован')
+
+
+class IdempotencyKey(models.Model):
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'],
+                name='unique_user_idempotency_key'
+            )
+        ]
+
+    MAX_LENGTH = 255
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        verbose_name='пользователь'
+    )
+    key = models.CharField(max_length=MAX_LENGTH, verbose_name='ключ')
+    request_hash = models.CharField(max_length=64,
+                                    verbose_name='хэш запроса')
+    response_status = models.PositiveSmallIntegerField(
+        null=True,
+        verbose_name='код ответа'
+    )
+    response_data = models.JSONField(null=True, encoder=DjangoJSONEncoder,
+                                     verbose_name='данные ответа')
+    expires_at = models.DateTimeField(verbose_name='истекает',
+                                      db_index=True)
+
+
+class OutboxEmailQuerySet(models.QuerySet):
+    def due(self):
+        return self.filter(status=OutboxEmail.StatusChoices.PENDING,
+                           next_attempt_at__lte=timezone.now())
+
+    def enqueue(self, subject: str, to: list, body: str = '',
+                bcc: list = (), confirmation_code_user=None,
+                confirmation_code: str = '') -> 'OutboxEmail':
+        'Adding email to outbox, it is sent by "send_outbox_emails" command'
+        return self.create(
+            subject=subject,
+            body=body,
+            to=list(to),
+            bcc=list(bcc),
+            confirmation_code_user=confirmation_code_user,
+            confirmation_code=confirmation_code
+        )
+
+
+class OutboxEmail(models.Model):
+    class Meta:
+        verbose_name = 'исходящее письмо'
+        verbose_name_plural = 'исходящие письма'
+
+    class StatusChoices(models.TextChoices):
+        PENDING = ('PENDING', 'Ожидает отправки')
+        SENT = ('SENT', 'Отправлено')
+        DEAD = ('DEAD', 'Не отправлено')
+
+    subject = models.CharField(max_length=255, verbose_name='тема')
+    body = models.TextField(blank=True, verbose_name='текст')
+    to = models.JSONField(verbose_name='получатели')
+    bcc = models.JSONField(default=list, blank=True,
+                           verbose_name='скрытые получатели')
+    status = models.CharField(
+        max_length=20,
+        choices=StatusChoices.choices,
+        default=StatusChoices.PENDING,
+        verbose_name='статус'
+    )
+    attempts = models.PositiveIntegerField(default=0,
+                                           verbose_name='попытки отправки')
+    next_attempt_at = models.DateTimeField(default=timezone.now,
+                                           db_index=True,
+                                           verbose_name='следующая попытка')
+    last_error = models.TextField(blank=True,
+                                  verbose_name='последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name='создано')
+    sent_at = models.DateTimeField(null=True, blank=True,
+                                   verbose_name='отправлено')
+    # Confirmation code of user marked as sent on delivery
+    confirmation_code_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='confirmation_codes_emails',
+        verbose_name='пользователь кода подтверждения'
+    )
+    confirmation_code = models.CharField(
+        max_length=ConfirmationCode.LENGTH,
+        blank=True,
+        verbose_name='код подтверждения'
+    )
+
+    objects = OutboxEmailQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.subject} (id={self.pk})'
+
+
+class AdminOrderNotification(models.Model):
+    'New order waiting for digest email to admins'
+    class Meta:
+        verbose_name = 'заказ для уведомления администраторов'
+        verbose_name_plural = 'заказы для уведомления администраторов'
+
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='admin_notification',
+        verbose_name='заказ'
+    )
+
 
 def get_model_concrete_fields_names(M) -> list:
-    return [f.name for f in M._meta.concrete_fields]
\ No newline at end of file
+    return [f.name for f in M._meta.concrete_fields]
+
+def get_quantities_case(quantities: dict):
+    'Quantity for each shop position id from {shop position id: quantity}'
+    return models.Case(
+        *[
+            models.When(pk=shop_pos_id, then=models.Value(quantity))
+            for shop_pos_id, quantity in quantities.items()
+        ],
+        output_field=models.PositiveIntegerField()
+    )
+
+def get_position_sum_expression():
+    'Position sum (quantity * shop position price) calculated by DB'
+    return models.ExpressionWrapper(
+        models.F('quantity') * models.F('shop_position__price'),
+        output_field=SUM_FIELD
+    )
\ No newline at end of file
@@ -0,0 +1,143 @@
+'''
+Delivery of emails from outbox.
+
+Emails are written to OutboxEmail table in the same transaction as the
+business change and sent later by "send_outbox_emails" command over one
+SMTP connection per batch. Admins get one email per order with all of
+them in BCC or, in digest mode, one email per ADMIN_ORDERS_DIGEST_INTERVAL
+about all new orders. Failed emails are retried with exponential
+backoff and marked as DEAD after EMAIL_OUTBOX_MAX_ATTEMPTS attempts.
+'''
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from api.confirmation_codes import get_confirmation_code_store
+from api.models import AdminOrderNotification, OutboxEmail, User
+
+
+# Time for sending claimed batch, after it emails can be claimed again
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def get_admins_emails() -> list:
+    return sorted(set(
+        User.objects
+            .filter(is_active=True, is_admin=True)
+            .values_list('email', flat=True)
+    ))
+
+def notify_admins_about_order(order_num):
+    '''
+    Adding one email to all admins about new order to outbox or
+    adding order to the next digest in digest mode
+    '''
+    if settings.ADMIN_ORDERS_DIGEST_INTERVAL:
+        AdminOrderNotification.objects.create(order_id=order_num)
+        return
+    admins_emails = get_admins_emails()
+    if admins_emails:
+        OutboxEmail.objects.enqueue(
+            subject=f'Создан заказ №{order_num}',
+            to=[],
+            bcc=admins_emails
+        )
+
+def enqueue_admin_orders_digest() -> int:
+    'Adding one email to all admins about orders created since last digest'
+    with transaction.atomic():
+        orders_nums = list(
+            AdminOrderNotification.objects
+                .select_for_update(skip_locked=True)
+                .order_by('order_id')
+                .values_list('order_id', flat=True)
+        )
+        if not orders_nums:
+            return 0
+        admins_emails = get_admins_emails()
+        if admins_emails:
+            OutboxEmail.objects.enqueue(
+                subject=f'Создано заказов: {len(orders_nums)}',
+                body='\n'.join(f'Заказ №{num}' for num in orders_nums),
+                to=[],
+                bcc=admins_emails
+            )
+        AdminOrderNotification.objects\
+            .filter(order_id__in=orders_nums)\
+            .delete()
+    return len(orders_nums)
+
+def send_due_emails(batch_size: int) -> tuple[int, int]:
+    'Sending batch of due emails, returns numbers of sent and failed emails'
+    db_emails = claim_due_emails(batch_size)
+    if not db_emails:
+        return 0, 0
+
+    sent_count = 0
+    connection = get_connection()
+    try:
+        for db_email in db_emails:
+            email_msg = EmailMessage(
+                subject=db_email.subject,
+                body=db_email.body,
+                to=db_email.to,
+                bcc=db_email.bcc,
+                connection=connection
+            )
+            try:
+                email_msg.send()
+            except Exception as e:
+                mark_failed(db_email, e)
+                # Reopening connection for the next email
+                connection.close()
+            else:
+                mark_sent(db_email)
+                sent_count += 1
+    finally:
+        connection.close()
+    return sent_count, len(db_emails) - sent_count
+
+def claim_due_emails(batch_size: int) -> list[OutboxEmail]:
+    'Getting due emails and postponing them for other workers'
+    with transaction.atomic():
+        db_emails = list(
+            OutboxEmail.objects
+                .due()
+                .select_for_update(skip_locked=True)
+                .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        OutboxEmail.objects\
+            .filter(pk__in=[e.pk for e in db_emails])\
+            .update(next_attempt_at=timezone.now() + CLAIM_TIMEOUT)
+    return db_emails
+
+def mark_sent(db_email: OutboxEmail):
+    now = timezone.now()
+    OutboxEmail.objects.filter(pk=db_email.pk).update(
+        status=OutboxEmail.StatusChoices.SENT,
+        attempts=db_email.attempts + 1,
+        sent_at=now,
+        last_error=''
+    )
+    if db_email.confirmation_code_user_id:
+        get_confirmation_code_store().mark_sent(
+            db_email.confirmation_code_user_id,
+            db_email.confirmation_code
+        )
+
+def mark_failed(db_email: OutboxEmail, error: Exception):
+    attempts = db_email.attempts + 1
+    if attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        new_status = OutboxEmail.StatusChoices.DEAD
+    else:
+        new_status = OutboxEmail.StatusChoices.PENDING
+    retry_delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    OutboxEmail.objects.filter(pk=db_email.pk).update(
+        status=new_status,
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=retry_delay),
+        last_error=repr(error)
+    )
@@ -0,0 +1,346 @@
+'''
+Checking SQL queries number and latency of API endpoints.
+
+Endpoints are requested on seeded data of two sizes: size is the number
+of shops, products, their parameters and shops positions, positions of
+the cart and orders and positions of every order. Number of SQL queries
+of every endpoint must be the same for both sizes (so N+1 queries are
+caught) and must not exceed its fixed budget. Latency of endpoint
+(median of several requests on the bigger data) is compared with its
+baseline recorded earlier on the same machine.
+'''
+import json
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.archive import archive_orders
+from api.models import (ArchivedOrder, CartPosition, Category, Order,
+                        ParameterName, Product, ProductParameter, Shop,
+                        ShopPosition, User)
+
+
+# Sizes of seeded data, queries numbers must be the same for them
+SIZES = (1, 30)
+
+# Age of seeded archived orders
+ARCHIVE_AGE_DAYS = 1000
+
+RECIPIENT_DATA = {
+    'recipient': {
+        'first_name': 'Иван',
+        'last_name': 'Иванов',
+        'patronymic': 'Иванович',
+        'email': 'ivanov@example.com',
+        'phone': '+79990000000',
+        'address': {
+            'city': 'Москва',
+            'street': 'Тверская',
+            'house_number': '1',
+            'house_block': '1',
+            'house_building': '1',
+            'appartment': '1'
+        }
+    }
+}
+
+
+class Endpoint:
+    def __init__(self, name: str, method: str, url: str, client: str,
+                 max_queries: int, data=None, prepare=None):
+        self.name = name
+        self.method = method
+        # Url can contain names of seeded objects ids: "{product}"
+        self.url = url
+        # Name of seeded user client: "customer" or "representative"
+        self.client = client
+        self.max_queries = max_queries
+        # Request data or function returning it for seeded data
+        self.data = data
+        # Function called with seeded data before every request
+        self.prepare = prepare
+
+    def get_data(self, seeded: dict):
+        if callable(self.data):
+            return self.data(seeded)
+        return self.data
+
+
+def fill_cart(seeded: dict):
+    'Filling customer cart with seeded positions of different shops'
+    customer = seeded['customer']
+    CartPosition.objects.filter(user=customer).delete()
+    CartPosition.objects.bulk_create(
+        CartPosition(user=customer, shop_position_id=shop_pos_id, quantity=1)
+        for shop_pos_id in seeded['cart_shop_positions']
+    )
+
+
+def reset_orders_status(seeded: dict):
+    'Returning seeded orders to NEW status'
+    Order.objects.filter(pk__in=seeded['orders'])\
+        .update(status=Order.StatusChoices.NEW)
+
+
+def get_cart_bulk_data(seeded: dict) -> list:
+    return [
+        {'action': 'update', 'shop_position': shop_pos_id, 'quantity': 2}
+        for shop_pos_id in seeded['cart_shop_positions']
+    ]
+
+
+def get_orders_status_data(seeded: dict) -> dict:
+    return {'orders': seeded['orders'],
+            'status': Order.StatusChoices.CONFIRMED}
+
+
+ENDPOINTS = [
+    Endpoint('products list', 'get', '/api/products/', 'customer', 7),
+    Endpoint('product', 'get', '/api/products/{product}/', 'customer', 7),
+    Endpoint('products search', 'get', '/api/products/?search=Товар',
+             'customer', 7),
+    Endpoint('cart', 'get', '/api/user/cart/', 'customer', 7,
+             prepare=fill_cart),
+    Endpoint('cart bulk', 'post', '/api/user/cart/bulk/', 'customer', 12,
+             data=get_cart_bulk_data, prepare=fill_cart),
+    Endpoint('cart hold', 'post', '/api/user/cart/hold/', 'customer', 13,
+             prepare=fill_cart),
+    Endpoint('orders list', 'get', '/api/user/orders/', 'customer', 4),
+    Endpoint('orders list with archived', 'get',
+             '/api/user/orders/?include_archived=1', 'customer', 6),
+    Endpoint('order', 'get', '/api/user/orders/{order}/', 'customer', 4),
+    Endpoint('archived order', 'get',
+             '/api/user/orders/{archived_order}/?include_archived=1',
+             'customer', 5),
+    Endpoint('order creation', 'post', '/api/user/orders/', 'customer', 30,
+             data=RECIPIENT_DATA, prepare=fill_cart),
+    Endpoint('recipients list', 'get', '/api/user/recipients/', 'customer',
+             3),
+    Endpoint('shops list', 'get', '/api/user/shops/', 'representative', 3),
+    Endpoint('shops stats', 'get', '/api/user/shops/stats/',
+             'representative', 3),
+    Endpoint('shops orders list', 'get', '/api/user/shops/orders/',
+             'representative', 5),
+    Endpoint('shops orders list with archived', 'get',
+             '/api/user/shops/orders/?include_archived=1', 'representative',
+             7),
+    Endpoint('shops order', 'get', '/api/user/shops/orders/{order}/',
+             'representative', 5),
+    Endpoint('shops archived order', 'get',
+             '/api/user/shops/orders/{archived_order}/?include_archived=1',
+             'representative', 6),
+    Endpoint('shops orders status', 'post', '/api/user/shops/orders/status/',
+             'representative', 7, data=get_orders_status_data,
+             prepare=reset_orders_status),
+    Endpoint('shops orders export', 'get', '/api/user/shops/orders/export/',
+             'representative', 4),
+    Endpoint('shops orders export to xlsx', 'get',
+             '/api/user/shops/orders/export/?file_format=xlsx',
+             'representative', 4),
+]
+
+
+def seed(size: int) -> dict:
+    '''
+    Seeding data: every product has size parameters and is sold
+    by size shops, cart and every order have size positions.
+    '''
+    customer = User.objects.create_user('customer@example.com', 'password')
+    representative = User.objects.create_user('representative@example.com',
+                                              'password')
+    for user in (customer, representative):
+        user.is_active = True
+        user.save()
+
+    shops = Shop.objects.bulk_create(
+        Shop(name=f'Магазин {i}', open=True) for i in range(size)
+    )
+    for shop in shops:
+        shop.representatives.add(representative)
+    categories = Category.objects.bulk_create(
+        Category(name=f'Категория {i}') for i in range(size)
+    )
+    parameters_names = ParameterName.objects.bulk_create(
+        ParameterName(name=f'Параметр {i}') for i in range(size)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f'Товар {i}', model=f'Модель {i}',
+                description=f'Описание {i}',
+                category=categories[i])
+        for i in range(size)
+    )
+    ProductParameter.objects.bulk_create(
+        ProductParameter(product=product, parameter_name=parameter_name,
+                         value=f'Значение {i}')
+        for product in products
+        for i, parameter_name in enumerate(parameters_names)
+    )
+    shop_positions = ShopPosition.objects.bulk_create(
+        ShopPosition(shop=shop, product=product,
+                     external_id=i * size + j,
+                     price=Decimal(100 + i), price_rrc=Decimal(120 + i),
+                     quantity=1000000)
+        for i, product in enumerate(products)
+        for j, shop in enumerate(shops)
+    )
+
+    # Cart of positions of different products and shops
+    cart_shop_positions = [
+        shop_positions[i * size + i].pk for i in range(size)
+    ]
+    seeded = {
+        'customer': customer,
+        'representative': representative,
+        'product': products[0].pk,
+        'cart_shop_positions': cart_shop_positions
+    }
+
+    # Creating orders of positions of all shops by API, the first orders
+    # are delivered long ago and moved to archive
+    client = APIClient()
+    client.force_authenticate(customer)
+    for i in range(size * 2):
+        if i == size:
+            Order.objects.filter(user=customer).update(
+                status=Order.StatusChoices.DELIVERED,
+                created_at=timezone.now() - timedelta(days=ARCHIVE_AGE_DAYS)
+            )
+            archive_orders(ARCHIVE_AGE_DAYS - 1, batch_size=size)
+        fill_cart(seeded)
+        response = client.post('/api/user/orders/', RECIPIENT_DATA,
+                               format='json')
+        if response.status_code != 201:
+            raise RuntimeError(f'Order was not created: {response.data}')
+    seeded['orders'] = list(
+        Order.objects.filter(user=customer).order_by('pk')
+            .values_list('pk', flat=True)
+    )
+    seeded['order'] = seeded['orders'][-1]
+    seeded['archived_order'] = ArchivedOrder.objects\
+        .filter(user=customer).latest('pk').pk
+
+    return seeded
+
+
+def check_endpoint(endpoint: Endpoint, seeded: dict,
+                   repeat: int) -> dict:
+    '''
+    Requesting endpoint repeat times.
+    Returns max number of queries and median latency in milliseconds.
+    '''
+    client = APIClient()
+    client.force_authenticate(seeded[endpoint.client])
+    url = endpoint.url.format(**seeded)
+
+    queries = []
+    latencies = []
+    for _ in range(repeat):
+        if endpoint.prepare:
+            endpoint.prepare(seeded)
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = getattr(client, endpoint.method)(
+                url, endpoint.get_data(seeded), format='json'
+            )
+            # Streaming content is read by queries during sending
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(
+                f'{endpoint.name}: response status {response.status_code}'
+            )
+        queries.append(len(context.captured_queries))
+
+    return {
+        'queries': max(queries),
+        'latency': statistics.median(latencies)
+    }
+
+
+def check_endpoints(size: int, repeat: int) -> dict:
+    '''
+    Returns results of checks on seeded data of the size
+    by endpoints names. Seeded data is rolled back.
+    '''
+    # Requests are not throttled and carts are stored in DB
+    with transaction.atomic(), override_settings(
+        CACHES={
+            **settings.CACHES,
+            'performance': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+            }
+        },
+        THROTTLE_CACHE_ALIAS='performance',
+        CART_STORAGE='db'
+    ):
+        seeded = seed(size)
+        results = {
+            endpoint.name: check_endpoint(endpoint, seeded, repeat)
+            for endpoint in ENDPOINTS
+        }
+        transaction.set_rollback(True)
+    return results
+
+
+def get_queries_errors(results_by_sizes: dict) -> list:
+    'Getting queries numbers depending on size of data'
+    errors = []
+    for endpoint in ENDPOINTS:
+        queries_by_sizes = {
+            size: results[endpoint.name]['queries']
+            for size, results in results_by_sizes.items()
+        }
+        if len(set(queries_by_sizes.values())) > 1:
+            errors.append(
+                f'{endpoint.name}: SQL queries depend on size of data: '
+                + ', '.join(f'{queries} at size {size}'
+                            for size, queries in queries_by_sizes.items())
+            )
+    return errors
+
+def get_errors(results_by_sizes: dict, baselines: dict,
+               factor: float) -> list:
+    '''
+    Getting queries numbers depending on size of data, exceeded queries
+    budgets and latency baselines (on the biggest size)
+    '''
+    errors = get_queries_errors(results_by_sizes)
+    results = results_by_sizes[max(results_by_sizes)]
+    for endpoint in ENDPOINTS:
+        result = results[endpoint.name]
+        if result['queries'] > endpoint.max_queries:
+            errors.append(
+                f'{endpoint.name}: {result["queries"]} SQL queries,'
+                f' budget is {endpoint.max_queries}'
+            )
+        baseline = baselines.get(endpoint.name)
+        if baseline and result['latency'] > baseline * factor:
+            errors.append(
+                f'{endpoint.name}: latency {result["latency"]:.1f} ms,'
+                f' baseline is {baseline:.1f} ms x {factor}'
+            )
+    return errors
+
+
+def load_baselines(path: Path) -> dict:
+    if not path.exists():
+        return dict()
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+def save_baselines(path: Path, results: dict):
+    baselines = {
+        name: round(result['latency'], 3)
+        for name, result in results.items()
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(baselines, file, ensure_ascii=False, indent=4)
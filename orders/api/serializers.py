@@ -1,11 +1,16 @@
-from django.db import IntegrityError
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
 from rest_framework import serializers, status
 import django.contrib.auth.password_validation
-from rest_framework.exceptions import APIException
 
-from api.models import (Address, CartPosition, Category, Order, OrderPosition,
+from api import metrics
+from api.cart_store import get_cart_store
+from api.models import (Address, ArchivedOrder, ArchivedOrderPosition,
+                        CartPosition, Category, Order, OrderPosition,
                         ParameterName, Product, ProductParameter, Recipient,
-                        Shop, ShopPosition, User)
+                        Shop, ShopPosition, ShopSalesDay, StockHold, User,
+                        UserRecipient)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -121,6 +126,14 @@ class CartPositionSerializerForRead(serializers.ModelSerializer):
         exclude = ['user']
 
     shop_position = ShopPositionSerializerForCartPosition()
+    sum = serializers.DecimalField(max_digits=28, decimal_places=2,
+                                   read_only=True)
+
+
+class CartTotalsSerializer(serializers.Serializer):
+    total_quantity = serializers.IntegerField(read_only=True)
+    total_sum = serializers.DecimalField(max_digits=28, decimal_places=2,
+                                         read_only=True)
 
 
 class CartPositionSerializerForWrite(serializers.ModelSerializer):
@@ -136,9 +149,18 @@ class CartPositionSerializerForWrite(serializers.ModelSerializer):
         if 'quantity' in self.validated_data:
             if self.instance:
                 db_shop_pos = self.instance.shop_position
+                user = self.instance.user
             else:
                 db_shop_pos = self.validated_data.get('shop_position')
+                request = self.context.get('request')
+                user = request.user if request else None
+            # Quantity held for the user is available for the user cart
             shop_pos_qnt = db_shop_pos.quantity
+            if user and user.is_authenticated:
+                shop_pos_qnt += StockHold.objects\
+                    .filter(shop_position=db_shop_pos)\
+                    .get_user_quantities(user)\
+                    .get(db_shop_pos.pk, 0)
             cart_pos_qnt = self.validated_data['quantity']
             if cart_pos_qnt > shop_pos_qnt:
                 error_msg = (f'The value received is {cart_pos_qnt}'
@@ -168,7 +190,10 @@ class CartPositionSerializerForWrite(serializers.ModelSerializer):
             }
             raise serializers.ValidationError(errors)
 
-        return super().create(validated_data)
+        return get_cart_store().add_position(**validated_data)
+
+    def update(self, instance, validated_data):
+        return get_cart_store().update_position(instance, **validated_data)
 
     def save(self, **kwargs):
         try:
@@ -177,12 +202,31 @@ class CartPositionSerializerForWrite(serializers.ModelSerializer):
             raise serializers.ValidationError(str(e))
 
 
+class CartBulkOperationSerializer(serializers.Serializer):
+    class ActionChoices(models.TextChoices):
+        ADD = ('add', 'Добавление')
+        UPDATE = ('update', 'Изменение')
+        REMOVE = ('remove', 'Удаление')
+
+    action = serializers.ChoiceField(choices=ActionChoices.choices)
+    shop_position = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        # Validating quantity field
+        if (attrs['action'] != self.ActionChoices.REMOVE
+            and 'quantity' not in attrs):
+            errors = {
+                'quantity': ['This field is required.']
+            }
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
 class OrderPositionSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderPosition
         exclude = ['order']
-    
-    shop_position = ShopPositionSerializerForCartPosition()
 
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -201,15 +245,34 @@ class RecipientSerializer(serializers.ModelSerializer):
     address = AddressSerializer()
 
 
+class UserRecipientAddressSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserRecipient
+        fields = UserRecipient.ADDRESS_FIELDS
+
+
+class UserRecipientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserRecipient
+        fields = ['id'] + UserRecipient.RECIPIENT_FIELDS + ['address']
+
+    address = UserRecipientAddressSerializer(source='*')
+
+
 class OrderSerializerForUser(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ['total_quantity', 'total_sum']
         extra_kwargs = {'user': {'write_only': True}}
     
     positions = OrderPositionSerializer(many=True, read_only=True)
     recipient = RecipientSerializer()
 
+    def is_valid(self, *args, **kwargs):
+        with metrics.phase_timer('order', 'validate'):
+            return super().is_valid(*args, **kwargs)
+
     def create(self, validated_data):
         copy_validated_data = validated_data.copy()
 
@@ -230,209 +293,171 @@ class OrderSerializerForUser(serializers.ModelSerializer):
                 'user': ['This field is required.']
             }
             raise serializers.ValidationError(errors)
-
-        # Setting status
-        order_validated_data['status'] = Order.StatusChoices.FORMATION
-
-        # Creating order
-        db_order = super().create(order_validated_data)
-
-        # Creating order recipient
-        recipient_validated_data['order'] = db_order
-        db_recipient = Recipient.objects.create(**recipient_validated_data)
-
-        # Creating order recipient address
-        address_validated_data['recipient'] = db_recipient
-        Address.objects.create(**address_validated_data)
-
-        # Getting cart positions
-        db_cart_positions =\
-            CartPosition.objects.filter(user=order_validated_data['user'])
-        if not db_cart_positions:
-            errors = {
-                'error': ['Your cart is empty.']
-            }
-            raise serializers.ValidationError(errors,
-                                              status.HTTP_404_NOT_FOUND)
-
-        # Creating order positions
-        http_error_status = status.HTTP_400_BAD_REQUEST
-        for db_cart_pos in db_cart_positions:
-            db_shop_pos = db_cart_pos.shop_position
-
-            # Checking shop position
-            if db_shop_pos.archived_at != None:
-                errors = {
-                    f'cart_position_id={db_cart_pos.pk}': {
-                        f'shop_position_id={db_shop_pos.pk}': [
-                            'This shop position is archived.'
-                        ]
-                    }
-                }
-                break
-            if not db_shop_pos.shop.open:
-                errors = {
-                    f'cart_position_id={db_cart_pos.pk}': {
-                        f'shop_position_id={db_shop_pos.pk}': {
-                            f'shop_id={db_shop_pos.shop.pk}': [
-                            'This shop is not currently accepting orders.'
-                            ]
-                        }
-                    }
-                }
-                break
-            if db_cart_pos.quantity > db_shop_pos.quantity:
+        user = order_validated_data['user']
+
+        # Writing cart to DB if it is stored in the cache
+        cart_store = get_cart_store()
+        cart_store.flush(user)
+
+        with transaction.atomic():
+            # Returning quantity held for user to shop positions,
+            # it will be reserved for order below
+            StockHold.objects.filter(user=user).release()
+
+            # Getting cart positions
+            db_cart_positions = list(
+                CartPosition.objects.filter(user=user).order_by('pk')
+            )
+            if not db_cart_positions:
                 errors = {
-                    f'cart_position_id={db_cart_pos.pk}': {
-                        f'shop_position_id={db_shop_pos.pk}': [
-                            f'Quantity of this cart position is'
-                            f' {db_cart_pos.quantity}, but quantity'
-                            f' of this shop position is currently only'
-                            f' {db_shop_pos.quantity}.'
-                        ]
-                    }
+                    'error': ['Your cart is empty.']
                 }
-                break
-
-            # Reservation quantity
-            db_shop_pos.quantity = db_shop_pos.quantity - db_cart_pos.quantity
-            try:
-                db_shop_pos.save()
-            except IntegrityError as e:
+                raise serializers.ValidationError(errors,
+                                                  status.HTTP_404_NOT_FOUND)
+
+            # Locking shop positions in the same order for all orders
+            db_shop_positions = ShopPosition.objects\
+                .select_related('shop', 'product')\
+                .select_for_update(of=('self',))\
+                .order_by('pk')\
+                .in_bulk([p.shop_position_id for p in db_cart_positions])
+
+            # Checking shop positions
+            for db_cart_pos in db_cart_positions:
+                db_shop_pos = db_shop_positions[db_cart_pos.shop_position_id]
+                errors = self.check_shop_position(db_cart_pos, db_shop_pos)
+                if errors:
+                    raise serializers.ValidationError(errors)
+
+            # Reservation quantity of all shop positions by one statement
+            reservation_quantities = {
+                db_cart_pos.shop_position_id: db_cart_pos.quantity
+                for db_cart_pos in db_cart_positions
+            }
+            if not ShopPosition.objects.reserve(reservation_quantities):
                 errors = {
-                    f'cart_position_id={db_cart_pos.pk}': {
-                        f'shop_position_id={db_shop_pos.pk}': {
-                            f'reservation_quantity_error': str(e)
-                        }
-                    }
+                    'error': [
+                        'Quantity of some cart positions is no longer'
+                        ' available in shops.'
+                    ]
                 }
-                break
-
-            # Creating order position
-            try:
-                OrderPosition.objects.create(
-                    order=db_order,
-                    shop_position=db_shop_pos,
-                    quantity=db_cart_pos.quantity
+                raise serializers.ValidationError(errors)
+
+            # Creating order positions with shop positions data
+            order_positions = []
+            for db_cart_pos in db_cart_positions:
+                order_pos = OrderPosition(quantity=db_cart_pos.quantity)
+                order_pos.fill_snapshot(
+                    db_shop_positions[db_cart_pos.shop_position_id]
                 )
-            except IntegrityError as e:
-                errors = {
-                    f'cart_position_id={db_cart_pos.pk}': {
-                        f'shop_position_id={db_shop_pos.pk}': {
-                            f'creating_order_position_error': str(e)
-                        }
-                    }
-                }
-                break
-        else:
-            # If order positions are successfully created
-            # # Deleting cart positions
-            try:
-                db_cart_positions.delete()
-            except IntegrityError as e:
-                errors = {
-                    'cart_positions_deleting_error': str(e)
+                order_positions.append(order_pos)
+
+            # Creating order with totals
+            order_validated_data['status'] = Order.StatusChoices.NEW
+            order_validated_data['total_quantity'] =\
+                sum(p.quantity for p in order_positions)
+            order_validated_data['total_sum'] =\
+                sum((p.sum for p in order_positions), Decimal(0))
+            db_order = super().create(order_validated_data)
+
+            # Creating order recipient
+            recipient_validated_data['order'] = db_order
+            db_recipient = Recipient.objects.create(**recipient_validated_data)
+
+            # Creating order recipient address
+            address_validated_data['recipient'] = db_recipient
+            Address.objects.create(**address_validated_data)
+
+            # Adding recipient to user address book
+            UserRecipient.objects.save_recipient(user,
+                                                 recipient_validated_data,
+                                                 address_validated_data)
+
+            # Saving order positions
+            for order_pos in order_positions:
+                order_pos.order = db_order
+            OrderPosition.objects.bulk_create(order_positions)
+
+            # Adding order to sales stats
+            ShopSalesDay.objects.add_orders([db_order.pk])
+
+            # Deleting cart positions
+            cart_store.clear(user)
+
+        return db_order
+
+    def check_shop_position(self, db_cart_pos, db_shop_pos) -> dict:
+        'Checking shop position is available for ordering'
+        if db_shop_pos.archived_at != None:
+            return {
+                f'cart_position_id={db_cart_pos.pk}': {
+                    f'shop_position_id={db_shop_pos.pk}': [
+                        'This shop position is archived.'
+                    ]
                 }
-                raise APIException(errors)
-
-            # # Changing order status to NEW
-            db_order.status = Order.StatusChoices.NEW
-            try:
-                db_order.save()
-            except IntegrityError as e:
-                errors = {
-                    'order_status_changing_error': str(e)
-                }
-                raise APIException(errors)
-
-            return db_order
-        
-        # If not all order positions created
-        # # Deleting created orders positions
-        for db_order_pos in db_order.positions.all():
-            db_shop_pos = db_order_pos.shop_position
-
-            # Cancel quantity reservation
-            db_shop_pos.quantity =\
-                db_shop_pos.quantity + db_order_pos.quantity
-            try:
-                db_shop_pos.save()
-            except IntegrityError as e:
-                http_error_status = status.HTTP_500_INTERNAL_SERVER_ERROR
-                errors['quantity_reservation_cancel_error'] = {
-                    f'shop_position_id={db_shop_pos.pk}': str(e)
+            }
+        if not db_shop_pos.shop.open:
+            return {
+                f'cart_position_id={db_cart_pos.pk}': {
+                    f'shop_position_id={db_shop_pos.pk}': {
+                        f'shop_id={db_shop_pos.shop.pk}': [
+                        'This shop is not currently accepting orders.'
+                        ]
+                    }
                 }
-
-            # Deleting order position
-            try:
-                db_order_pos.delete()
-            except IntegrityError as e:
-                http_error_status = status.HTTP_500_INTERNAL_SERVER_ERROR
-                errors['deleting_order_position_error'] = {
-                    f'shop_position_id={db_shop_pos.pk}': str(e)
+            }
+        if db_cart_pos.quantity > db_shop_pos.quantity:
+            return {
+                f'cart_position_id={db_cart_pos.pk}': {
+                    f'shop_position_id={db_shop_pos.pk}': [
+                        f'Quantity of this cart position is'
+                        f' {db_cart_pos.quantity}, but quantity'
+                        f' of this shop position is currently only'
+                        f' {db_shop_pos.quantity}.'
+                    ]
                 }
+            }
+        return {}
 
-        # # Deleting order
-            try:
-                db_order.delete()
-            except IntegrityError as e:
-                http_error_status = status.HTTP_500_INTERNAL_SERVER_ERROR
-                errors['deleting_order_error'] = str(e)
-
-        # # Raising exception
-        raise APIException(errors, http_error_status)
-
-    def to_representation(self, instance):
-        default_data = super().to_representation(instance)
-
-        # Adding additional data
-        custom_data = default_data.copy()
-        order_total_quantity: int = 0
-        order_total_sum: float = 0
-        for order_pos in custom_data['positions']:
-            order_pos_quantity = order_pos['quantity']
-            shop_position = order_pos['shop_position']
-            shop_position_price = float(shop_position['price'])
-            order_pos_sum =\
-                shop_position_price * order_pos_quantity
-            
-            # Adding order position sum
-            order_pos['sum'] = order_pos_sum
-
-            order_total_quantity += order_pos_quantity
-
-            order_total_sum += order_pos_sum
-        # Adding order total quantity
-        custom_data['total_quantity'] = order_total_quantity
-        # Adding order total sum
-        custom_data['total_sum'] = str(order_total_sum)
-
-        return custom_data
-    
 
 class OrderSerializerForShop(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = '__all__'
+        exclude = ['total_quantity', 'total_sum']
         extra_kwargs = {'user': {'write_only': True}}
     
     positions = OrderPositionSerializer(many=True, read_only=True)
     recipient = RecipientSerializer()
 
-    def to_representation(self, instance):
-        default_data = super().to_representation(instance)
-
-        # Adding additional data
-        custom_data = default_data.copy()
-        for order_pos in custom_data['positions']:
-            order_pos_quantity = order_pos['quantity']
-            shop_position = order_pos['shop_position']
-            shop_position_price = float(shop_position['price'])
-            order_pos_sum =\
-                shop_position_price * order_pos_quantity
-            
-            # Adding order position sum
-            order_pos['sum'] = order_pos_sum
-
-        return custom_data
-    
\ No newline at end of file
+
+class ArchivedOrderPositionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderPosition
+        exclude = ['order', 'product', 'category']
+
+
+class ArchivedOrderSerializerForUser(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrder
+        exclude = ['user']
+
+    positions = ArchivedOrderPositionSerializer(many=True, read_only=True)
+    recipient = serializers.JSONField(read_only=True)
+
+
+class ArchivedOrderSerializerForShop(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrder
+        exclude = ['user', 'total_quantity', 'total_sum']
+
+    positions = ArchivedOrderPositionSerializer(many=True, read_only=True)
+    recipient = serializers.JSONField(read_only=True)
+
+
+class OrdersStatusSerializer(serializers.Serializer):
+    MAX_ORDERS = 1000
+
+    orders = serializers.ListField(child=serializers.IntegerField(),
+                                   allow_empty=False,
+                                   max_length=MAX_ORDERS)
+    status = serializers.ChoiceField(choices=Order.StatusChoices.choices)
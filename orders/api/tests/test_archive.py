@@ -0,0 +1,55 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api.archive import archive_orders
+from api.models import (ArchivedOrderPosition, Category, Order, OrderPosition,
+                        Product, Shop, ShopPosition, ShopSalesDay, User)
+
+
+class ArchiveSalesStatsTests(APITestCase):
+    def setUp(self):
+        customer = User.objects.create_user('customer@example.com',
+                                            'password')
+        self.representative = User.objects.create_user(
+            'representative@example.com', 'password'
+        )
+        shop = Shop.objects.create(name='Магазин', open=True)
+        shop.representatives.add(self.representative)
+        self.product = Product.objects.create(
+            name='Товар',
+            category=Category.objects.create(name='Категория')
+        )
+        shop_position = ShopPosition.objects.create(
+            shop=shop, product=self.product, external_id=1,
+            price=Decimal(10), quantity=10
+        )
+        order = Order.objects.create(user=customer,
+                                     status=Order.StatusChoices.DELIVERED)
+        order_position = OrderPosition(order=order, quantity=2)
+        order_position.fill_snapshot(shop_position)
+        order_position.save()
+        Order.objects.filter(pk=order.pk).update(
+            created_at=timezone.now() - timedelta(days=400)
+        )
+        ShopSalesDay.objects.rebuild()
+
+    def get_stats(self) -> list:
+        self.client.force_authenticate(self.representative)
+        response = self.client.get('/api/user/shops/stats/')
+        self.assertEqual(response.status_code, 200)
+        return [(stat['quantity'], stat['revenue']) for stat in response.data]
+
+    def test_archived_orders_sales_are_rebuilt(self):
+        self.assertEqual(self.get_stats(), [(2, '20.00')])
+        self.assertEqual(archive_orders(age_days=365, batch_size=10), 1)
+        self.assertFalse(OrderPosition.objects.exists())
+        archived_order_position = ArchivedOrderPosition.objects.get()
+        self.assertEqual(archived_order_position.product_id, self.product.pk)
+        self.assertEqual(archived_order_position.category_id,
+                         self.product.category_id)
+
+        ShopSalesDay.objects.rebuild()
+        self.assertEqual(self.get_stats(), [(2, '20.00')])
@@ -0,0 +1,117 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from api.cart_store import CacheCartStore, CartLocked
+from api.checks import check_cart_storage
+from api.models import (CartPosition, Category, Product, Shop, ShopPosition,
+                        User)
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test_cart_store'
+    }
+}
+
+
+@override_settings(CACHES=CACHES)
+class CacheCartStoreTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.store = CacheCartStore('default', 60)
+        self.user = User.objects.create_user('customer@example.com',
+                                             'password')
+        shop = Shop.objects.create(name='Магазин', open=True)
+        product = Product.objects.create(
+            name='Товар',
+            category=Category.objects.create(name='Категория')
+        )
+        self.shop_position = ShopPosition.objects.create(
+            shop=shop, product=product, external_id=1, price=10,
+            quantity=10
+        )
+
+    def test_changes_are_not_lost(self):
+        with self.store.lock(self.user):
+            cart_state = self.store.get_state(self.user)
+            # Other request waits for the lock and gives up
+            other_store = CacheCartStore('default', 60)
+            other_store.LOCK_WAIT = 0
+            with self.assertRaises(CartLocked):
+                other_store.add_position(self.user, self.shop_position, 1)
+            cart_state[self.shop_position.pk] = 2
+            self.store.set_state(self.user, cart_state)
+        self.assertEqual(self.store.get_state(self.user),
+                         {self.shop_position.pk: 2})
+
+    def test_expired_lock_is_detected(self):
+        with self.store.lock(self.user):
+            cart_state = self.store.get_state(self.user)
+            # Lock expires and other request changes the cart
+            caches['default'].delete(self.store.get_lock_key(self.user.pk))
+            CacheCartStore('default', 60).set_state(self.user, {})
+            with self.assertRaises(CartLocked):
+                self.store.set_state(self.user, cart_state)
+
+    def test_dirty_cart_does_not_expire(self):
+        cache = caches['default']
+        self.store.set_state(self.user, {self.shop_position.pk: 1})
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.store.set_state(self.user, {self.shop_position.pk: 2})
+        self.assertIsNone(cache_set.call_args.kwargs['timeout'])
+
+        self.store.flush(self.user)
+        self.assertEqual(
+            list(CartPosition.objects.values_list('shop_position',
+                                                  'quantity')),
+            [(self.shop_position.pk, 2)]
+        )
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.store.flush(self.user)
+            self.store.set_state(self.user, {})
+            self.store.flush(self.user)
+        self.assertEqual(cache_set.call_args.args[2], 60)
+
+    def test_not_written_dirty_record_is_not_skipped(self):
+        cache = caches['default']
+        other_user = User.objects.create_user('other@example.com',
+                                              'password')
+        self.store.log_dirty_user(self.user.pk)
+        # Number of the record is taken, but the record is not written yet
+        cache.incr('cart:dirty_counter')
+        self.store.log_dirty_user(other_user.pk)
+
+        self.assertEqual(self.store.pop_dirty_users_ids(), {self.user.pk})
+        cache.set('cart:dirty:2', self.user.pk, timeout=None)
+        self.assertEqual(self.store.pop_dirty_users_ids(),
+                         {self.user.pk, other_user.pk})
+        self.assertEqual(self.store.pop_dirty_users_ids(), set())
+
+    def test_lost_dirty_record_is_skipped(self):
+        cache = caches['default']
+        cache.add('cart:dirty_counter', 0, timeout=None)
+        cache.incr('cart:dirty_counter')
+        self.store.log_dirty_user(self.user.pk)
+
+        self.assertEqual(self.store.pop_dirty_users_ids(), set())
+        self.store.DIRTY_RECORD_WAIT = -1
+        self.assertEqual(self.store.pop_dirty_users_ids(), {self.user.pk})
+
+
+class CartStorageCheckTests(TestCase):
+    @override_settings(CART_STORAGE='cache', CACHES=CACHES)
+    def test_per_process_cache_is_rejected(self):
+        errors = check_cart_storage(None)
+        self.assertEqual([error.id for error in errors], ['api.E001'])
+
+    @override_settings(CART_STORAGE='cache', CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/test_cart_store'
+        }
+    })
+    def test_shared_cache_is_accepted(self):
+        self.assertEqual(check_cart_storage(None), [])
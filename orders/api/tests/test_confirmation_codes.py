@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from api.confirmation_codes import CacheConfirmationCodeStore
+from api.models import User
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test_confirmation_codes'
+    }
+})
+class CacheConfirmationCodeStoreTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.store = CacheConfirmationCodeStore('default', 60)
+        self.user = User.objects.create_user('customer@example.com',
+                                             'password')
+
+    def test_invalid_attempts_are_limited(self):
+        value = self.store.create(self.user)
+        with override_settings(CONFIRMATION_CODE_MAX_ATTEMPTS=2):
+            self.assertFalse(self.store.check(self.user, 'invalid'))
+            self.assertFalse(self.store.check(self.user, 'invalid'))
+        self.assertIsNone(self.store.check(self.user, value))
+
+    def test_code_is_expired_if_attempts_counter_is_lost(self):
+        value = self.store.create(self.user)
+        cache = caches['default']
+        # Counter is evicted between adding and incrementing
+        with mock.patch.object(cache, 'incr', side_effect=ValueError):
+            self.assertIsNone(self.store.check(self.user, 'invalid'))
+        self.assertIsNone(self.store.check(self.user, value))
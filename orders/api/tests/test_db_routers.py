@@ -0,0 +1,105 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.checks import check_db_replicas
+from api.db_routers import use_replicas
+from api.models import Category, Product, Shop, ShopPosition, User
+
+
+REPLICA_ALIAS = 'replica_test'
+
+# Replica is the connection to the test database of the primary,
+# it is registered before test databases are set up
+connections.settings[REPLICA_ALIAS] = {
+    **connections.settings[DEFAULT_DB_ALIAS],
+    'TEST': {'MIRROR': DEFAULT_DB_ALIAS}
+}
+
+
+@override_settings(DB_REPLICAS=[REPLICA_ALIAS])
+class ReplicaRouterTests(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+
+    def setUp(self):
+        # Removing pins of previous tests
+        caches[settings.DB_REPLICA_PIN_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user('customer@example.com',
+                                             'password')
+        self.user.is_active = True
+        self.user.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(
+            name='Товар',
+            category=Category.objects.create(name='Категория')
+        )
+        self.shop_position = ShopPosition.objects.create(
+            shop=Shop.objects.create(name='Магазин', open=True),
+            product=product, external_id=1, price=10, quantity=10
+        )
+
+    def get_queries_numbers(self, method: str, url: str,
+                            data: dict = None) -> dict:
+        'Returns numbers of queries of request by databases aliases'
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in (DEFAULT_DB_ALIAS, REPLICA_ALIAS)
+            ]
+            response = getattr(self.client, method)(url, data,
+                                                    format='json')
+        self.assertLess(response.status_code, 400)
+        return {
+            context.connection.alias: len(context.captured_queries)
+            for context in contexts
+        }
+
+    def test_router_reads_from_replica_only_if_allowed(self):
+        self.assertEqual(Product.objects.all().db, DEFAULT_DB_ALIAS)
+        token = use_replicas.set(True)
+        try:
+            self.assertEqual(Product.objects.all().db, REPLICA_ALIAS)
+            product = Product.objects.get()
+            self.assertEqual(product._state.db, REPLICA_ALIAS)
+            # Objects read from replica are saved to the primary
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS])\
+                    as context:
+                product.save()
+            self.assertEqual(context.connection.alias, DEFAULT_DB_ALIAS)
+            self.assertTrue(context.captured_queries)
+        finally:
+            use_replicas.reset(token)
+
+    def test_safe_request_reads_from_replica(self):
+        queries_numbers = self.get_queries_numbers('get', '/api/products/')
+        self.assertGreater(queries_numbers[REPLICA_ALIAS], 0)
+
+    def test_user_is_pinned_to_primary_after_change(self):
+        self.get_queries_numbers(
+            'post', '/api/user/cart/',
+            {'shop_position': self.shop_position.pk, 'quantity': 1}
+        )
+        queries_numbers = self.get_queries_numbers('get', '/api/products/')
+        self.assertEqual(queries_numbers[REPLICA_ALIAS], 0)
+        self.assertGreater(queries_numbers[DEFAULT_DB_ALIAS], 0)
+
+
+class ReplicasCheckTests(TestCase):
+    @override_settings(DB_REPLICAS=[REPLICA_ALIAS], CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }
+    })
+    def test_per_process_cache_is_rejected(self):
+        errors = check_db_replicas(None)
+        self.assertEqual([error.id for error in errors], ['api.E002'])
+
+    @override_settings(DB_REPLICAS=[])
+    def test_no_replicas_are_accepted(self):
+        self.assertEqual(check_db_replicas(None), [])
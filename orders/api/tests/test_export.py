@@ -0,0 +1,84 @@
+import io
+import warnings
+
+from django.test import AsyncClient, TestCase
+from openpyxl import load_workbook
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import export
+from api.models import (Category, Order, OrderPosition, Product, Shop,
+                        ShopPosition, User)
+from api.performance import seed
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(10)
+        cls.token = Token.objects.create(user=cls.seeded['representative'])
+        # Representative has all seeded shops
+        cls.rows_number = OrderPosition.objects.count()
+
+    def test_csv_is_streamed_by_sync_iterator_under_wsgi(self):
+        client = APIClient()
+        client.force_authenticate(self.seeded['representative'])
+        response = client.get('/api/user/shops/orders/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), self.rows_number + 1)
+
+    async def test_csv_is_streamed_by_async_iterator_under_asgi(self):
+        client = AsyncClient()
+        response = await client.get(
+            '/api/user/shops/orders/export/',
+            headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        # Sync iterator would be collected to the list with warning
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            content = b''.join([part async for part in response])
+        lines = content.decode().splitlines()
+        self.assertEqual(len(lines), self.rows_number + 1)
+
+    async def test_xlsx_is_streamed_by_async_iterator_under_asgi(self):
+        client = AsyncClient()
+        response = await client.get(
+            '/api/user/shops/orders/export/',
+            {'file_format': 'xlsx'},
+            headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            content = b''.join([part async for part in response])
+        worksheet = load_workbook(io.BytesIO(content)).active
+        self.assertEqual(worksheet.max_row, self.rows_number + 1)
+
+
+class ExportRowsTests(TestCase):
+    def test_recipient_cell_is_empty_without_recipient(self):
+        user = User.objects.create_user('customer@example.com', 'password')
+        product = Product.objects.create(
+            name='Товар',
+            category=Category.objects.create(name='Категория')
+        )
+        shop_position = ShopPosition.objects.create(
+            shop=Shop.objects.create(name='Магазин', open=True),
+            product=product, external_id=1, price=10, quantity=10
+        )
+        order = Order.objects.create(user=user,
+                                     status=Order.StatusChoices.NEW)
+        order_position = OrderPosition(order=order, quantity=1)
+        order_position.fill_snapshot(shop_position)
+        order_position.save()
+
+        header, row = export.get_rows(OrderPosition.objects.all())
+        self.assertIsNone(row[header.index('recipient')])
+        lines = ''.join(export.get_csv_lines(OrderPosition.objects.all()))\
+            .splitlines()
+        self.assertEqual(lines[1].split(',')[3], '')
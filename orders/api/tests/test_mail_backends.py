@@ -0,0 +1,80 @@
+import socket
+
+from django.core.mail import EmailMessage, get_connection
+from django.test import SimpleTestCase, override_settings
+
+from api import mail_backends
+from api.load_testing import SMTPSink, SMTPSinkHandler
+
+
+class CountingSMTPSinkHandler(SMTPSinkHandler):
+    def handle(self):
+        self.server.sink.add_connection(self.connection)
+        super().handle()
+
+
+class CountingSMTPSink(SMTPSink):
+    'SMTP sink counting connections and DATA commands'
+    def __init__(self):
+        super().__init__('127.0.0.1', 0)
+        self.server.RequestHandlerClass = CountingSMTPSinkHandler
+        self.port = self.server.server_address[1]
+        self.connections = []
+        self.data_count = 0
+
+    def add_connection(self, connection: socket.socket):
+        with self.condition:
+            self.connections.append(connection)
+
+    def add(self, recipients: list, data: bytes):
+        super().add(recipients, data)
+        with self.condition:
+            self.data_count += 1
+
+    def drop_connections(self):
+        'Closing connections by the server side'
+        with self.condition:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+@override_settings(EMAIL_USE_TLS=False, EMAIL_USE_SSL=False,
+                   EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+                   EMAIL_POOL_SIZE=4, EMAIL_POOL_IDLE_TIMEOUT=60)
+class PooledEmailBackendTests(SimpleTestCase):
+    def setUp(self):
+        mail_backends.pools.clear()
+        self.sink = CountingSMTPSink()
+        self.sink.start()
+        self.addCleanup(self.sink.stop)
+        self.addCleanup(mail_backends.pools.clear)
+
+    def send(self, number: int):
+        'Sending every message by new backend as outbox does'
+        for i in range(number):
+            connection = get_connection(
+                'api.mail_backends.PooledEmailBackend',
+                host='127.0.0.1',
+                port=self.sink.port,
+                fail_silently=False
+            )
+            message = EmailMessage(f'Письмо {i}', f'Текст {i}',
+                                   'shop@example.com',
+                                   [f'customer{i}@example.com'],
+                                   connection=connection)
+            self.assertEqual(message.send(), 1)
+
+    def test_connection_is_reused(self):
+        self.send(10)
+        self.assertEqual(len(self.sink.connections), 1)
+        self.assertEqual(self.sink.data_count, 10)
+
+    def test_dropped_connection_is_reopened(self):
+        self.send(2)
+        self.sink.drop_connections()
+        self.send(3)
+        self.assertEqual(len(self.sink.connections), 2)
+        self.assertEqual(self.sink.data_count, 5)
@@ -0,0 +1,23 @@
+from django.test import TestCase, override_settings
+
+
+class MetricsViewTests(TestCase):
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_metrics_are_denied_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_metrics_are_available_in_debug_mode(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='token', DEBUG=False)
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer wrong'}
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer token'}
+        )
+        self.assertEqual(response.status_code, 200)
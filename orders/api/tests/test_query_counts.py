@@ -0,0 +1,54 @@
+from django.test import SimpleTestCase, TestCase
+
+from api import performance
+
+
+class QueryCountsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.results_by_sizes = {
+            size: performance.check_endpoints(size, repeat=2)
+            for size in performance.SIZES
+        }
+
+    def test_queries_numbers_do_not_depend_on_size(self):
+        for endpoint in performance.ENDPOINTS:
+            with self.subTest(endpoint.name):
+                queries_numbers = [
+                    results[endpoint.name]['queries']
+                    for results in self.results_by_sizes.values()
+                ]
+                self.assertEqual(len(set(queries_numbers)), 1,
+                                 queries_numbers)
+
+    def test_queries_numbers_are_within_budgets(self):
+        for endpoint in performance.ENDPOINTS:
+            with self.subTest(endpoint.name):
+                for results in self.results_by_sizes.values():
+                    self.assertLessEqual(results[endpoint.name]['queries'],
+                                         endpoint.max_queries)
+
+
+class LatencyBaselinesTests(SimpleTestCase):
+    BASELINES = {'products list': 10.0}
+
+    def get_errors(self, latency: float) -> list:
+        'Getting errors of results with the same latency of all endpoints'
+        results_by_sizes = {
+            size: {
+                endpoint.name: {'queries': 1, 'latency': latency}
+                for endpoint in performance.ENDPOINTS
+            }
+            for size in performance.SIZES
+        }
+        return performance.get_errors(results_by_sizes, self.BASELINES,
+                                      factor=1.5)
+
+    def test_latency_within_factor_is_accepted(self):
+        self.assertEqual(self.get_errors(latency=15.0), [])
+
+    def test_latency_above_factor_is_rejected(self):
+        self.assertEqual(
+            self.get_errors(latency=15.1),
+            ['products list: latency 15.1 ms, baseline is 10.0 ms x 1.5']
+        )
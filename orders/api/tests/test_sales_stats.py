@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.models import (Category, Order, OrderPosition, Product, Shop,
+                        ShopPosition, ShopSalesDay, User)
+
+
+class ShopSalesDayTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('customer@example.com',
+                                             'password')
+        self.shop = Shop.objects.create(name='Магазин', open=True)
+        self.category = Category.objects.create(name='Категория')
+
+    def create_order(self, positions_number: int) -> Order:
+        order = Order.objects.create(user=self.user,
+                                     status=Order.StatusChoices.NEW)
+        for i in range(positions_number):
+            product = Product.objects.create(name=f'Товар {i}',
+                                             category=self.category)
+            shop_position = ShopPosition.objects.create(
+                shop=self.shop, product=product, external_id=i,
+                price=Decimal(10), quantity=10
+            )
+            order_position = OrderPosition(order=order, quantity=2)
+            order_position.fill_snapshot(shop_position)
+            order_position.save()
+        return order
+
+    def add_orders(self, orders_ids, sign: int) -> int:
+        'Returns number of queries'
+        with CaptureQueriesContext(connection) as context:
+            ShopSalesDay.objects.add_orders(orders_ids, sign)
+        return len(context.captured_queries)
+
+    def test_queries_number_does_not_depend_on_positions(self):
+        small_order = self.create_order(1)
+        big_order = self.create_order(40)
+        ShopSalesDay.objects.all().delete()
+
+        self.assertEqual(self.add_orders([small_order.pk], 1),
+                         self.add_orders([big_order.pk], 1))
+        self.assertEqual(self.add_orders([small_order.pk], -1),
+                         self.add_orders([big_order.pk], -1))
+
+    def test_sales_are_added_and_subtracted(self):
+        order = self.create_order(3)
+        ShopSalesDay.objects.all().delete()
+
+        for _ in range(2):
+            ShopSalesDay.objects.add_orders([order.pk])
+        ShopSalesDay.objects.add_orders([order.pk], sign=-1)
+        self.assertEqual(
+            sorted(ShopSalesDay.objects.values_list('quantity', 'revenue')),
+            [(2, Decimal(20))] * 3
+        )
+
+    def test_canceled_formation_order_is_not_subtracted(self):
+        counted_order = self.create_order(1)
+        formation_order = self.create_order(1)
+        Order.objects.filter(pk=formation_order.pk)\
+            .update(status=Order.StatusChoices.FORMATION)
+        ShopSalesDay.objects.rebuild()
+
+        changed_orders_ids = Order.objects\
+            .filter(pk__in=[counted_order.pk, formation_order.pk])\
+            .change_status(Order.StatusChoices.CANCELED)
+        self.assertEqual(sorted(changed_orders_ids),
+                         [counted_order.pk, formation_order.pk])
+        self.assertEqual(
+            list(ShopSalesDay.objects.values_list('quantity', 'revenue')),
+            [(0, Decimal(0))]
+        )
@@ -0,0 +1,87 @@
+from rest_framework.test import APITestCase
+
+from api.models import (CartPosition, Category, Order, Product, Shop,
+                        ShopPosition, User)
+
+
+RECIPIENT_DATA = {
+    'recipient': {
+        'first_name': 'Иван',
+        'last_name': 'Иванов',
+        'patronymic': 'Иванович',
+        'email': 'ivanov@example.com',
+        'phone': '+79990000000',
+        'address': {
+            'city': 'Москва',
+            'street': 'Тверская',
+            'house_number': '1',
+            'house_block': '1',
+            'house_building': '1',
+            'appartment': '1'
+        }
+    }
+}
+
+
+class ShopsOrdersStatusTests(APITestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user('customer@example.com',
+                                                 'password')
+        self.representative = User.objects.create_user(
+            'representative@example.com', 'password'
+        )
+        for user in (self.customer, self.representative):
+            user.is_active = True
+            user.save()
+        product = Product.objects.create(
+            name='Товар',
+            category=Category.objects.create(name='Категория')
+        )
+        self.shop_positions = []
+        for i in range(2):
+            shop = Shop.objects.create(name=f'Магазин {i}', open=True)
+            self.shop_positions.append(ShopPosition.objects.create(
+                shop=shop, product=product, external_id=i, price=10,
+                quantity=10
+            ))
+        # Representative of the first shop only
+        self.shop_positions[0].shop.representatives.add(self.representative)
+
+    def create_order(self, shop_positions) -> int:
+        CartPosition.objects.bulk_create(
+            CartPosition(user=self.customer, shop_position=shop_position,
+                         quantity=1)
+            for shop_position in shop_positions
+        )
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/user/orders/', RECIPIENT_DATA,
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.latest('pk').pk
+
+    def change_status(self, order_id: int, new_status: str):
+        self.client.force_authenticate(self.representative)
+        return self.client.post(
+            '/api/user/shops/orders/status/',
+            {'orders': [order_id], 'status': new_status},
+            format='json'
+        )
+
+    def test_order_of_user_shop_is_changed(self):
+        order_id = self.create_order(self.shop_positions[:1])
+        response = self.change_status(order_id, Order.StatusChoices.CANCELED)
+        self.assertEqual(response.data['changed'], [order_id])
+        self.assertEqual(Order.objects.get(pk=order_id).status,
+                         Order.StatusChoices.CANCELED)
+
+    def test_order_of_several_shops_is_not_changed(self):
+        order_id = self.create_order(self.shop_positions)
+        status = Order.objects.get(pk=order_id).status
+        response = self.change_status(order_id, Order.StatusChoices.CANCELED)
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual(response.data['errors'], {
+            f'order_id={order_id}': [
+                'Order contains positions of other shops.'
+            ]
+        })
+        self.assertEqual(Order.objects.get(pk=order_id).status, status)
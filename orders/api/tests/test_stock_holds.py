@@ -0,0 +1,57 @@
+from rest_framework.test import APITestCase
+
+from api.models import (CartPosition, Category, Product, Shop, ShopPosition,
+                        User)
+
+
+class StockHoldCartTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('customer@example.com',
+                                             'password')
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(
+            name='Товар',
+            category=Category.objects.create(name='Категория')
+        )
+        self.shop_position = ShopPosition.objects.create(
+            shop=Shop.objects.create(name='Магазин', open=True),
+            product=product, external_id=1, price=10, quantity=5
+        )
+        self.cart_position = CartPosition.objects.create(
+            user=self.user, shop_position=self.shop_position, quantity=5
+        )
+        response = self.client.post('/api/user/cart/hold/')
+        self.assertEqual(response.status_code, 201)
+        self.shop_position.refresh_from_db()
+        self.assertEqual(self.shop_position.quantity, 0)
+
+    def test_held_quantity_is_lowered(self):
+        response = self.client.patch(
+            f'/api/user/cart/{self.cart_position.pk}/',
+            {'quantity': 4},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CartPosition.objects.get().quantity, 4)
+
+    def test_held_quantity_is_lowered_by_bulk_update(self):
+        response = self.client.post(
+            '/api/user/cart/bulk/',
+            [{'action': 'update', 'shop_position': self.shop_position.pk,
+              'quantity': 3}],
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['status'], 'ok')
+        self.assertEqual(CartPosition.objects.get().quantity, 3)
+
+    def test_quantity_above_held_is_rejected(self):
+        response = self.client.patch(
+            f'/api/user/cart/{self.cart_position.pk}/',
+            {'quantity': 6},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartPosition.objects.get().quantity, 5)
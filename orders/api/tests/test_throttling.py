@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory
+
+from api.throttling import ReadThrottle
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test_throttling'
+    }
+}, THROTTLE_CACHE_ALIAS='default')
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.request = APIRequestFactory().get('/api/products/')
+        self.request.user = None
+
+    def get_throttle(self) -> ReadThrottle:
+        throttle = ReadThrottle()
+        throttle.rate = '2/min'
+        throttle.num_requests, throttle.duration = throttle.parse_rate('2/min')
+        throttle.timer = lambda: 1000.0
+        return throttle
+
+    def allow_request(self) -> bool:
+        return self.get_throttle().allow_request(self.request, None)
+
+    def test_requests_above_capacity_are_rejected(self):
+        self.assertEqual([self.allow_request() for _ in range(3)],
+                         [True, True, False])
+
+    def test_bucket_is_restarted_if_counter_is_lost(self):
+        self.allow_request()
+        self.allow_request()
+        cache = caches['default']
+        # Counter is evicted between incrementing and decrementing
+        with mock.patch.object(cache, 'decr', side_effect=ValueError):
+            self.assertFalse(self.allow_request())
+        self.assertTrue(self.allow_request())
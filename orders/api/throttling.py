@@ -0,0 +1,104 @@
+'''
+Token bucket throttling of requests.
+
+Bucket of scope is filled with "number" tokens of rate "number/period"
+during period and holds at most "number" tokens, every request takes
+one token. Requests of authenticated users are counted by user,
+requests of anonymous users - by IP address.
+
+Bucket is kept in the Django cache as the time of its start and the
+counter of taken tokens, which is changed by atomic increments, so
+processes sharing the cache share buckets.
+'''
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    # Keys of not used buckets are deleted by cache after this timeout,
+    # bucket is full by that time
+    KEY_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        self.wait_seconds = None
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{self.scope}:{ident}'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        capacity = self.num_requests
+        fill_rate = self.num_requests / self.duration
+        start_key = f'{key}:start'
+        taken_key = f'{key}:taken'
+        now = self.timer()
+
+        start = self.cache.get(start_key)
+        if start is None:
+            # Starting full bucket
+            start = now
+            self.cache.set_many({start_key: start, taken_key: 0},
+                                self.KEY_TIMEOUT)
+        try:
+            taken = self.cache.incr(taken_key)
+        except ValueError:
+            # Counter was deleted by cache
+            self.cache.set(taken_key, 1, self.KEY_TIMEOUT)
+            taken = 1
+
+        # Tokens put to the bucket since its start
+        filled = capacity + (now - start) * fill_rate
+        if taken > filled:
+            # Returning token which was not taken
+            try:
+                self.cache.decr(taken_key)
+            except ValueError:
+                # Counter was deleted by cache, starting full bucket
+                self.cache.set_many({start_key: now, taken_key: 0},
+                                    self.KEY_TIMEOUT)
+            self.wait_seconds = math.ceil((taken - filled) / fill_rate)
+            return False
+
+        if filled - (taken - 1) > capacity:
+            # Bucket was overfilled after idle time, moving its start
+            # so that it held capacity tokens before this request
+            self.cache.set(start_key, now - (taken - 1) / fill_rate,
+                           self.KEY_TIMEOUT)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ReadThrottle(TokenBucketThrottle):
+    'Budget for cheap reads and changes'
+    scope = 'read'
+
+
+class SearchThrottle(TokenBucketThrottle):
+    'Budget for expensive searches, used for requests with search query'
+    scope = 'search'
+
+    def get_cache_key(self, request, view):
+        if not request.query_params.get('search'):
+            return None
+        return super().get_cache_key(request, view)
+
+
+class ImportThrottle(TokenBucketThrottle):
+    'Budget for imports of shop positions'
+    scope = 'import'
@@ -1,11 +1,21 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
 from django import forms
-from django.core.mail import EmailMessage
-from django.db import IntegrityError
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, Sum
+from django.http import Http404
 from django.utils import timezone as django_timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.filters import SearchFilter
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.generics import CreateAPIView, UpdateAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -14,15 +24,28 @@ import yaml
 from jsonschema import validate as schema_validate
 from jsonschema.exceptions import ValidationError as SchemaValidationError
 
-from api.serializers import (CartPositionSerializerForWrite,
+from api import export, idempotency, metrics, outbox
+from api.async_views import AsyncReadViewSetMixin
+from api.cart_store import get_cart_store
+from api.confirmation_codes import get_confirmation_code_store
+from api.db_routers import ReplicaReadViewSetMixin
+from api.throttling import ImportThrottle, ReadThrottle, SearchThrottle
+from api.serializers import (ArchivedOrderSerializerForShop,
+                             ArchivedOrderSerializerForUser,
+                             CartPositionSerializerForWrite,
                              CartPositionSerializerForRead,
+                             CartBulkOperationSerializer,
+                             CartTotalsSerializer, OrdersStatusSerializer,
                              OrderSerializerForUser, OrderSerializerForShop,
-                             RecipientSerializer, ParameterNameSerializer,
+                             ParameterNameSerializer,
                              ProductSerializer, ShopSerializerForRead,
-                             ShopSerializerForWrite, UserSerializer)
-from api.models import (CartPosition, Category, ConfirmationCode, Order,
-                        Product, ProductParameter, Recipient, Shop,
-                        ShopPosition, User)
+                             ShopSerializerForWrite, UserRecipientSerializer,
+                             UserSerializer)
+from api.models import (ArchivedOrder, ArchivedOrderPosition, CartPosition,
+                        Category, ConfirmationCode, Order, OrderPosition,
+                        OutboxEmail, Product, ProductParameter, Shop,
+                        ShopPosition, ShopSalesDay, StockHold, User,
+                        UserRecipient)
 
 
 class CreateUserView(CreateAPIView):
@@ -30,14 +53,15 @@ class CreateUserView(CreateAPIView):
     serializer_class = UserSerializer
     
     def perform_create(self, serializer):
-        result = super().perform_create(serializer)
-        
-        created_user = serializer.instance
+        with transaction.atomic():
+            result = super().perform_create(serializer)
 
-        send_confirmation_code_by_email(
-            user=created_user,
-            email_subject='Код подтверждения email'
-        )
+            created_user = serializer.instance
+
+            send_confirmation_code_by_email(
+                user=created_user,
+                email_subject='Код подтверждения email'
+            )
 
         return result
 
@@ -75,26 +99,15 @@ class EmailVerification(APIView):
             }
             raise ValidationError(errors)
 
-        # Getting confirmation code from DB
-        try:
-            db_confirmation_code = ConfirmationCode.objects.get(user=user)
-        except ConfirmationCode.DoesNotExist:
-            errors = {
-                'error': ['Confirmation code for this user was not found.']
-            }
-            raise ValidationError(errors, status.HTTP_404_NOT_FOUND)
-        
         # Confirmation code verification
         req_confirmation_code = str(request.data['confirmation_code'])
-        if req_confirmation_code != db_confirmation_code.value:
-            errors = {
-                'confirmation_code': ['This code is invalid.']
-            }
-            raise ValidationError(errors)
+        confirmation_code_store = get_confirmation_code_store()
+        check_confirmation_code(confirmation_code_store, user,
+                                req_confirmation_code)
         user.email_confirmed = True
         user.is_active = True
         user.save()
-        db_confirmation_code.delete()
+        confirmation_code_store.delete(user)
         resp_data = {
             'result': f'Email {req_email} verified.'
         }
@@ -173,23 +186,11 @@ class ForgotPasswordView(APIView):
             }
             raise ValidationError(errors, status.HTTP_404_NOT_FOUND)
         
-        # Getting confirmation code from DB
-        try:
-            db_confirmation_code =\
-                ConfirmationCode.objects.get(user=user)
-        except ConfirmationCode.DoesNotExist:
-            errors = {
-                'error': ['Confirmation code for this user was not found.']
-            }
-            raise ValidationError(errors, status.HTTP_404_NOT_FOUND)
-        
         # Confirmation code verification
         req_confirmation_code = str(req_data['confirmation_code'])
-        if req_confirmation_code != db_confirmation_code.value:
-            errors = {
-                'confirmation_code': ['This code is invalid.']
-            }
-            raise ValidationError(errors)
+        confirmation_code_store = get_confirmation_code_store()
+        check_confirmation_code(confirmation_code_store, user,
+                                req_confirmation_code)
 
         # Password change
         serializer_data = {
@@ -200,7 +201,7 @@ class ForgotPasswordView(APIView):
         user_serializer.is_valid(raise_exception=True)
         user_serializer.save()
 
-        db_confirmation_code.delete()
+        confirmation_code_store.delete(user)
 
         resp_data = {
             'result': ['Password changed.']
@@ -208,15 +209,21 @@ class ForgotPasswordView(APIView):
         return Response(resp_data)
         
 
-class ProductsViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductsViewSet(AsyncReadViewSetMixin,
+                      ReplicaReadViewSetMixin,
+                      viewsets.ReadOnlyModelViewSet):
     queryset = Product.objects\
         .exclude(shops_positions=None)\
         .filter(shops__open=True,
                 shops_positions__quantity__gt=0,
                 shops_positions__archived_at=None)\
-        .distinct()
+        .distinct()\
+        .select_related('category')\
+        .prefetch_related('parameters__parameter_name',
+                          'shops_positions__shop')
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ReadThrottle, SearchThrottle]
     filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ['name', 'model']
     search_fields = ['name', 'description', 'model', 'category__name']
@@ -274,9 +281,70 @@ class UserShopsViewSet(viewsets.mixins.UpdateModelMixin,
         return super().get_queryset()\
             .filter(representatives=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        'Getting sales stats of user shops from daily stats'
+        # Validating query params
+        stats_form = ShopsStatsForm({
+            'date_from': request.query_params.get('from'),
+            'date_to': request.query_params.get('to'),
+            'group_by': request.query_params.get('group_by') or 'day',
+            'shop': request.query_params.get('shop'),
+            'limit': request.query_params.get('limit'),
+        })
+        if not stats_form.is_valid():
+            raise ValidationError(stats_form.errors)
+        params = stats_form.cleaned_data
+
+        db_stats = ShopSalesDay.objects.filter(
+            shop__in=self.get_queryset().values('pk')
+        )
+        if params['shop']:
+            db_stats = db_stats.filter(shop=params['shop'])
+        if params['date_from']:
+            db_stats = db_stats.filter(day__gte=params['date_from'])
+        if params['date_to']:
+            db_stats = db_stats.filter(day__lte=params['date_to'])
+
+        # Grouping stats
+        group_by_fields = ShopsStatsForm.GROUP_BY_FIELDS[params['group_by']]
+        db_stats = db_stats\
+            .values(*group_by_fields)\
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        if params['group_by'] == 'day':
+            db_stats = db_stats.order_by('day')
+        else:
+            db_stats = db_stats.order_by('-revenue', *group_by_fields)
+        if params['limit']:
+            db_stats = db_stats[:params['limit']]
+
+        resp_data = [
+            {**stat, 'revenue': str(stat['revenue'].quantize(Decimal('0.01')))}
+            for stat in db_stats
+        ]
+        return Response(resp_data)
+
+
+class ShopsStatsForm(forms.Form):
+    GROUP_BY_FIELDS = {
+        'day': ['day'],
+        'shop': ['shop', 'shop__name'],
+        'product': ['product', 'product__name'],
+        'category': ['category', 'category__name'],
+    }
+
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    group_by = forms.ChoiceField(
+        choices=[(name, name) for name in GROUP_BY_FIELDS]
+    )
+    shop = forms.IntegerField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1)
+
 
 class UpdateShopPositionsView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ImportThrottle]
 
     def post(self, request):
         yaml_file = request.FILES.get('yaml')
@@ -286,212 +354,219 @@ class UpdateShopPositionsView(APIView):
             }
             raise ValidationError(errors)
         
-        try:
-            file_data = yaml.load(yaml_file, Loader=yaml.FullLoader)
-        except Exception as e:
-            errors = {
-                'error': ['File parsing error.']
-            }
-            raise ValidationError(errors)
+        with metrics.phase_timer('import', 'parse'):
+            try:
+                file_data = yaml.load(yaml_file, Loader=yaml.FullLoader)
+            except Exception as e:
+                errors = {
+                    'error': ['File parsing error.']
+                }
+                raise ValidationError(errors)
 
-        # Validating data schema
-        schema = {
-            'type': 'object',
-            'properties': {
-                'shop': {'type': 'string'},
-                'categories': {
-                    'type': 'array',
-                    'items': {
-                        'type': 'object',
-                        'properties': {
-                            'id': {'type': 'number'},
-                            'name': {'type': 'string'}
-                        },
-                        'required': [
-                            'id',
-                            'name'
-                        ]
+        with metrics.phase_timer('import', 'validate'):
+            # Validating data schema
+            schema = {
+                'type': 'object',
+                'properties': {
+                    'shop': {'type': 'string'},
+                    'categories': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'id': {'type': 'number'},
+                                'name': {'type': 'string'}
+                            },
+                            'required': [
+                                'id',
+                                'name'
+                            ]
+                        }
+                    },
+                    'goods': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'id': {'type': 'number'},
+                                'name': {'type': 'string'},
+                                'category': {'type': 'number'},
+                                'model': {'type': 'string'},
+                                'description': {'type': 'string'},
+                                'price': {'type': 'number'},
+                                'price_rrc': {'type': 'number'},
+                                'quantity': {'type': 'number'},
+                                'parameters': {
+                                    'type': 'object'
+                                }
+                            },
+                            'required': [
+                                'id',
+                                'name',
+                                'category',
+                                'price',
+                                'quantity'
+                            ]
+                        }
                     }
                 },
-                'goods': {
-                    'type': 'array',
-                    'items': {
-                        'type': 'object',
-                        'properties': {
-                            'id': {'type': 'number'},
-                            'name': {'type': 'string'},
-                            'category': {'type': 'number'},
-                            'model': {'type': 'string'},
-                            'description': {'type': 'string'},
-                            'price': {'type': 'number'},
-                            'price_rrc': {'type': 'number'},
-                            'quantity': {'type': 'number'},
-                            'parameters': {
-                                'type': 'object'
-                            }
-                        },
-                        'required': [
-                            'id',
-                            'name',
-                            'category',
-                            'price',
-                            'quantity'
-                        ]
-                    }
-                }
-            },
-            'required': [
-                'shop',
-                'categories',
-                'goods'
-            ]
-        }
-        try:
-            schema_validate(file_data, schema)
-        except SchemaValidationError as e:
-            errors = {
-                'file_validation_error': [e.message]
+                'required': [
+                    'shop',
+                    'categories',
+                    'goods'
+                ]
             }
-            raise ValidationError(errors)
-
-        # Validating shop
-        shop_name = file_data['shop']
-        try:
-            shop = Shop.objects.get(name=shop_name)
-        except Shop.DoesNotExist:
-            errors = {
-                'error': [f'Shop "{shop_name}" was not found.']
-            }
-            raise ValidationError(errors, status.HTTP_404_NOT_FOUND)
-
-        # Validating user permissions
-        if not request.user in shop.representatives.all():
-            errors = {
-                'error': [f'You are not "{shop_name}" shop representative.']
-            }
-            raise PermissionDenied(errors)
-
-        file_categories_dict = dict()
-        for file_category in file_data['categories']:
-            file_category_id = file_category.pop('id')
-            file_category_without_id = file_category
-            file_categories_dict[file_category_id] = file_category_without_id
-
-        # Validating goods categories
-        for file_product in file_data['goods']:
-            file_product_category = file_product['category']
-            if not file_product_category in file_categories_dict.keys():
+            try:
+                schema_validate(file_data, schema)
+            except SchemaValidationError as e:
                 errors = {
-                    'validation_error': [
-                        f'Category with id={file_product_category}'
-                        f' for product with id={file_product["id"]}'
-                        f' was not found in the file.'
-                    ]
+                    'file_validation_error': [e.message]
                 }
                 raise ValidationError(errors)
 
-        # Deleting/archiving shop positions in DB
-        db_shop_positions = ShopPosition.objects.filter(
-            shop=shop,
-            archived_at=None
-        )
-        for db_shop_position in db_shop_positions:
-            if (db_shop_position.orders_positions.all() or
-                db_shop_position.carts_positions.all()):
-                db_shop_position.quantity = 0
-                db_shop_position.archived_at = django_timezone.now()
-                db_shop_position.save()
-            else:
-                db_shop_position_product = db_shop_position.product
-                db_shop_position.delete()
-                if not db_shop_position_product.shops_positions.all():
-                    db_shop_position_product.delete()
-
-        # Adding goods to DB
-        for file_product in file_data['goods']:
-            # Getting or creating category
-            file_product_category_name =\
-                file_categories_dict[file_product.pop('category')]['name']
+            # Validating shop
+            shop_name = file_data['shop']
             try:
-                db_category, _ = Category.objects.get_or_create(
-                    name=file_product_category_name)
-            except IntegrityError as e:
+                shop = Shop.objects.get(name=shop_name)
+            except Shop.DoesNotExist:
                 errors = {
-                    'creating_category_error': {
-                       f'name_{file_product_category_name}': e.args[0]
-                    }
+                    'error': [f'Shop "{shop_name}" was not found.']
                 }
-                raise ValidationError(errors)
-            
-            # Creating product
-            try:
-                db_product = Product.objects.create(
-                    name=file_product['name'],
-                    model=file_product.get('model'),
-                    description=file_product.get('description'),
-                    category=db_category
-                )
-            except IntegrityError as e:
+                raise ValidationError(errors, status.HTTP_404_NOT_FOUND)
+
+            # Validating user permissions
+            if not request.user in shop.representatives.all():
                 errors = {
-                    'creating_product_error': {
-                       f'id_{file_product["id"]}': e.args[0]
-                    }
+                    'error': [
+                        f'You are not "{shop_name}" shop representative.'
+                    ]
                 }
-                raise ValidationError(errors)
+                raise PermissionDenied(errors)
+
+            file_categories_dict = dict()
+            for file_category in file_data['categories']:
+                file_category_id = file_category.pop('id')
+                file_category_without_id = file_category
+                file_categories_dict[file_category_id] =\
+                    file_category_without_id
+
+            # Validating goods categories
+            for file_product in file_data['goods']:
+                file_product_category = file_product['category']
+                if not file_product_category in file_categories_dict.keys():
+                    errors = {
+                        'validation_error': [
+                            f'Category with id={file_product_category}'
+                            f' for product with id={file_product["id"]}'
+                            f' was not found in the file.'
+                        ]
+                    }
+                    raise ValidationError(errors)
 
-            # Creating product parameters
-            for param_name, param_value in file_product['parameters'].items():
-                # Getting or creating parameter name
-                serializer = ParameterNameSerializer(
-                    data={'name': param_name}
-                )
-                serializer.is_valid()
-                serializer_errors = serializer._errors
-                if serializer_errors:
+        with metrics.phase_timer('import', 'write'):
+            # Deleting/archiving shop positions in DB
+            db_shop_positions = ShopPosition.objects.filter(
+                shop=shop,
+                archived_at=None
+            )
+            for db_shop_position in db_shop_positions:
+                if (db_shop_position.orders_positions.all() or
+                    db_shop_position.carts_positions.all()):
+                    db_shop_position.quantity = 0
+                    db_shop_position.archived_at = django_timezone.now()
+                    db_shop_position.save()
+                else:
+                    db_shop_position_product = db_shop_position.product
+                    db_shop_position.delete()
+                    if not db_shop_position_product.shops_positions.all():
+                        db_shop_position_product.delete()
+
+            # Adding goods to DB
+            for file_product in file_data['goods']:
+                # Getting or creating category
+                file_product_category_name =\
+                    file_categories_dict[file_product.pop('category')]['name']
+                try:
+                    db_category, _ = Category.objects.get_or_create(
+                        name=file_product_category_name)
+                except IntegrityError as e:
                     errors = {
-                        'product_parameter_validation_error': {
-                            f'id_{file_product["id"]}': {
-                                param_name: serializer_errors
-                            }
+                        'creating_category_error': {
+                           f'name_{file_product_category_name}': e.args[0]
                         }
                     }
                     raise ValidationError(errors)
-                db_parameter_name = serializer.save()
-                
-                # Creating product parameter
+            
+                # Creating product
                 try:
-                    ProductParameter.objects.create(
-                        product=db_product,
-                        parameter_name=db_parameter_name,
-                        value=param_value
+                    db_product = Product.objects.create(
+                        name=file_product['name'],
+                        model=file_product.get('model'),
+                        description=file_product.get('description'),
+                        category=db_category
                     )
                 except IntegrityError as e:
                     errors = {
-                        'creating_product_parameter_error': {
-                            f'id_{file_product["id"]}': {
-                                f'parameter_{param_name}': e.args[0]
-                            }
+                        'creating_product_error': {
+                           f'id_{file_product["id"]}': e.args[0]
                         }
                     }
                     raise ValidationError(errors)
 
-            # Creating shop positon
-            try:
-                ShopPosition.objects.create(
-                    shop=shop,
-                    product=db_product,
-                    external_id=file_product['id'],
-                    price=file_product['price'],
-                    price_rrc=file_product.get('price_rrc'),
-                    quantity=file_product['quantity']
-                )
-            except IntegrityError as e:
-                errors = {
-                    'creating_shop_position_error': {
-                       f'id_{file_product["id"]}': e.args[0]
+                # Creating product parameters
+                file_product_parameters = file_product['parameters']
+                for param_name, param_value in file_product_parameters.items():
+                    # Getting or creating parameter name
+                    serializer = ParameterNameSerializer(
+                        data={'name': param_name}
+                    )
+                    serializer.is_valid()
+                    serializer_errors = serializer._errors
+                    if serializer_errors:
+                        errors = {
+                            'product_parameter_validation_error': {
+                                f'id_{file_product["id"]}': {
+                                    param_name: serializer_errors
+                                }
+                            }
+                        }
+                        raise ValidationError(errors)
+                    db_parameter_name = serializer.save()
+                
+                    # Creating product parameter
+                    try:
+                        ProductParameter.objects.create(
+                            product=db_product,
+                            parameter_name=db_parameter_name,
+                            value=param_value
+                        )
+                    except IntegrityError as e:
+                        errors = {
+                            'creating_product_parameter_error': {
+                                f'id_{file_product["id"]}': {
+                                    f'parameter_{param_name}': e.args[0]
+                                }
+                            }
+                        }
+                        raise ValidationError(errors)
+
+                # Creating shop positon
+                try:
+                    ShopPosition.objects.create(
+                        shop=shop,
+                        product=db_product,
+                        external_id=file_product['id'],
+                        price=file_product['price'],
+                        price_rrc=file_product.get('price_rrc'),
+                        quantity=file_product['quantity']
+                    )
+                except IntegrityError as e:
+                    errors = {
+                        'creating_shop_position_error': {
+                           f'id_{file_product["id"]}': e.args[0]
+                        }
                     }
-                }
-                raise ValidationError(errors)
+                    raise ValidationError(errors)
             
         resp_data = {
             'status': 'Data import was successful.'
@@ -499,7 +574,8 @@ class UpdateShopPositionsView(APIView):
         return Response(resp_data, status.HTTP_201_CREATED)
 
 
-class UserCartViewSet(viewsets.mixins.CreateModelMixin,
+class UserCartViewSet(AsyncReadViewSetMixin,
+                      viewsets.mixins.CreateModelMixin,
                       viewsets.mixins.UpdateModelMixin,
                       viewsets.mixins.DestroyModelMixin,
                       viewsets.mixins.ListModelMixin,
@@ -507,41 +583,54 @@ class UserCartViewSet(viewsets.mixins.CreateModelMixin,
     queryset = CartPosition.objects.all()
     serializer_class = CartPositionSerializerForWrite
     permission_classes = [IsAuthenticated]
+    throttle_classes = [ReadThrottle]
 
     def get_queryset(self):
         # Filtering queryset by request user
         return super().get_queryset().filter(user=self.request.user)
 
+    def get_object(self):
+        # Getting cart position from cart storage
+        obj = get_cart_store().get_position(self.request.user,
+                                            self.kwargs['pk'])
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def perform_destroy(self, instance):
+        get_cart_store().delete_position(instance)
+
     def list(self, request, *args, **kwargs):
-        # Changing default serializer
-        default_serializer = self.serializer_class
-        self.serializer_class = CartPositionSerializerForRead
-        default_response = super().list(request, *args, **kwargs)
-        self.serializer_class = default_serializer
+        cart_store = get_cart_store()
+        db_cart_positions = cart_store.get_positions(request.user)
 
         # Adding additional data to response data
-        cart_positions = default_response.data
-        cart_total_quantity: int = 0
-        cart_total_sum: float = 0
+        cart_positions =\
+            CartPositionSerializerForRead(db_cart_positions, many=True).data
+
+        # Getting shops positions of cart products by one query
+        products_ids = {
+            cart_pos['shop_position']['product']['id']
+            for cart_pos in cart_positions
+        }
+        db_products_shops_positions = defaultdict(list)
+        for db_shop_pos in ShopPosition.objects\
+            .filter(product__in=products_ids)\
+            .filter(archived_at=None)\
+            .exclude(quantity=0)\
+            .exclude(shop__open=False)\
+            .select_related('shop')\
+            .order_by('pk'):
+            db_products_shops_positions[db_shop_pos.product_id]\
+                .append(db_shop_pos)
+
         for cart_pos in cart_positions:
-            cart_pos_quantity = cart_pos['quantity']
             shop_position = cart_pos['shop_position']
-            shop_position_price = float(shop_position['price'])
-            
-            # Adding cart position sum
-            cart_pos['sum'] =\
-                shop_position_price * cart_pos_quantity
-            
+
             # Adding product shops list with
             # shop position info (id, price, quantity)
             product_id = shop_position['product']['id']
-            db_product_shops_positions = ShopPosition.objects\
-                .filter(product=product_id)\
-                .filter(archived_at=None)\
-                .exclude(quantity=0)\
-                .exclude(shop__open=False)
             product_shops_data = []
-            for db_shop_pos in db_product_shops_positions:
+            for db_shop_pos in db_products_shops_positions[product_id]:
                 product_shop_data =\
                     ShopSerializerForRead(db_shop_pos.shop).data
                 product_shop_data['position'] = {
@@ -552,27 +641,236 @@ class UserCartViewSet(viewsets.mixins.CreateModelMixin,
                 product_shops_data.append(product_shop_data)
             cart_pos['product_shops'] = product_shops_data
 
-            cart_total_quantity += cart_pos_quantity
-
-            cart_total_sum += shop_position_price
+        # Getting totals
+        cart_totals =\
+            cart_store.get_totals(request.user, db_cart_positions)
         custom_data = {
             # Moving positions to subdict positions
             'positions': cart_positions,
-            # Adding total quantity
-            'total_quantity': cart_total_quantity,
-            # Adding total sum
-            'total_sum': str(cart_total_sum)
+            # Adding total quantity and total sum
+            **CartTotalsSerializer(cart_totals).data
         }
 
         return Response(custom_data)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        'Applying list of add/update/remove operations to the cart'
+        if not isinstance(request.data, list):
+            errors = {
+                'error': ['Expected a list of operations.']
+            }
+            raise ValidationError(errors)
+
+        # Validating operations fields
+        results = []
+        operations = []
+        for operation_data in request.data:
+            serializer = CartBulkOperationSerializer(data=operation_data)
+            if serializer.is_valid():
+                operations.append((len(results), serializer.validated_data))
+                results.append({**serializer.validated_data, 'status': 'ok'})
+            else:
+                results.append({'status': 'error',
+                                'errors': serializer.errors})
+
+        # Getting shop positions from DB at once
+        shop_positions_ids = set(o['shop_position'] for _, o in operations)
+        db_shop_positions = ShopPosition.objects\
+            .filter(archived_at=None)\
+            .in_bulk(shop_positions_ids)
+        # Quantity held for the user is available for the user cart
+        held_quantities = StockHold.objects\
+            .filter(shop_position__in=shop_positions_ids)\
+            .get_user_quantities(request.user)
+
+        # Applying operations to the cart state in memory, cart is locked
+        # until the state is saved
+        cart_store = get_cart_store()
+        with cart_store.lock(request.user):
+            cart_state = cart_store.get_state(request.user)
+            Actions = CartBulkOperationSerializer.ActionChoices
+            for result_idx, operation in operations:
+                shop_pos_id = operation['shop_position']
+                cart_pos_qnt = cart_state.get(shop_pos_id)
+                errors = None
+                if operation['action'] == Actions.REMOVE:
+                    if cart_pos_qnt is None:
+                        errors = {
+                            'shop_position': [
+                                'This shop position is not in the cart.'
+                            ]
+                        }
+                    else:
+                        cart_state.pop(shop_pos_id)
+                elif shop_pos_id not in db_shop_positions:
+                    errors = {
+                        'shop_position': [
+                            f'Invalid pk "{shop_pos_id}"'
+                            f' - object does not exist.'
+                        ]
+                    }
+                elif (operation['action'] == Actions.UPDATE
+                      and cart_pos_qnt is None):
+                    errors = {
+                        'shop_position': [
+                            'This shop position is not in the cart.'
+                        ]
+                    }
+                else:
+                    new_cart_pos_qnt = operation['quantity']
+                    if operation['action'] == Actions.ADD and cart_pos_qnt:
+                        new_cart_pos_qnt += cart_pos_qnt
+
+                    # Checking quantity
+                    shop_pos_qnt = db_shop_positions[shop_pos_id].quantity\
+                        + held_quantities.get(shop_pos_id, 0)
+                    if new_cart_pos_qnt > shop_pos_qnt:
+                        errors = {
+                            'quantity': [
+                                f'The value received is {new_cart_pos_qnt}'
+                                f', but quantity of this shop position'
+                                f' is only {shop_pos_qnt}'
+                            ]
+                        }
+                    else:
+                        cart_state[shop_pos_id] = new_cart_pos_qnt
+
+                if errors:
+                    results[result_idx]['status'] = 'error'
+                    results[result_idx]['errors'] = errors
+
+            # Saving cart state
+            try:
+                cart_store.set_state(request.user, cart_state)
+            except IntegrityError as e:
+                errors = {
+                    'cart_positions_saving_error': str(e)
+                }
+                raise ValidationError(errors)
+
+        return Response(results)
 
-class UserOrdersViewSet(viewsets.mixins.CreateModelMixin,
+    @action(detail=False, methods=['post', 'delete'])
+    def hold(self, request):
+        'Holding shop positions quantity for cart positions before ordering'
+        if request.method == 'DELETE':
+            StockHold.objects.filter(user=request.user).release()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        with transaction.atomic():
+            # Returning previously held quantity to shop positions
+            StockHold.objects.filter(user=request.user).release()
+
+            cart_state = get_cart_store().get_state(request.user)
+            if not cart_state:
+                errors = {
+                    'error': ['Your cart is empty.']
+                }
+                raise ValidationError(errors)
+
+            # Checking shop positions locked in the same order
+            # for all holds and orders
+            db_shop_positions = ShopPosition.objects\
+                .select_for_update()\
+                .order_by('pk')\
+                .in_bulk(cart_state.keys())
+            errors = dict()
+            for shop_pos_id, cart_pos_qnt in cart_state.items():
+                db_shop_pos = db_shop_positions.get(shop_pos_id)
+                if db_shop_pos is None or db_shop_pos.archived_at != None:
+                    errors[f'shop_position_id={shop_pos_id}'] = [
+                        'This shop position is not available.'
+                    ]
+                elif cart_pos_qnt > db_shop_pos.quantity:
+                    errors[f'shop_position_id={shop_pos_id}'] = [
+                        f'Quantity of this cart position is {cart_pos_qnt}'
+                        f', but quantity of this shop position is'
+                        f' currently only {db_shop_pos.quantity}.'
+                    ]
+            if errors:
+                raise ValidationError(errors)
+
+            # Holding quantity
+            ShopPosition.objects.reserve(cart_state)
+            expires_at = django_timezone.now()\
+                + timedelta(seconds=settings.STOCK_HOLD_TTL)
+            StockHold.objects.bulk_create([
+                StockHold(
+                    user=request.user,
+                    shop_position_id=shop_pos_id,
+                    quantity=cart_pos_qnt,
+                    expires_at=expires_at
+                )
+                for shop_pos_id, cart_pos_qnt in cart_state.items()
+            ])
+
+        resp_data = {
+            'expires_at': expires_at,
+            'positions': [
+                {'shop_position': shop_pos_id, 'quantity': cart_pos_qnt}
+                for shop_pos_id, cart_pos_qnt in cart_state.items()
+            ]
+        }
+        return Response(resp_data, status.HTTP_201_CREATED)
+
+
+class ArchivedOrdersMixin:
+    '''
+    Adding orders from archive tables to list and retrieve responses
+    if "include_archived" query parameter is set
+    '''
+    archived_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not self.is_archived_included():
+            return response
+
+        # Filtering archived orders by the same filterset fields
+        db_archived_orders =\
+            self.filter_queryset(self.get_archived_queryset())
+        archived_serializer = self.archived_serializer_class(
+            db_archived_orders,
+            many=True
+        )
+        response.data = list(response.data) + list(archived_serializer.data)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            if not self.is_archived_included():
+                raise
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            db_archived_order = self.get_archived_queryset()\
+                .get(pk=kwargs[lookup_url_kwarg])
+        except (ArchivedOrder.DoesNotExist, ValueError):
+            raise Http404
+        archived_serializer = self.archived_serializer_class(db_archived_order)
+        return Response(archived_serializer.data)
+
+    def is_archived_included(self) -> bool:
+        return self.request.query_params.get('include_archived')\
+            in ('1', 'true')
+
+    def get_archived_queryset(self):
+        raise NotImplementedError
+
+
+class UserOrdersViewSet(AsyncReadViewSetMixin,
+                        ReplicaReadViewSetMixin,
+                        ArchivedOrdersMixin,
+                        viewsets.mixins.CreateModelMixin,
                         viewsets.mixins.RetrieveModelMixin,
                         viewsets.mixins.ListModelMixin,
                         viewsets.GenericViewSet):
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_positions()
     serializer_class = OrderSerializerForUser
+    archived_serializer_class = ArchivedOrderSerializerForUser
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'created_at']
@@ -580,131 +878,202 @@ class UserOrdersViewSet(viewsets.mixins.CreateModelMixin,
     def get_queryset(self):
         # Filtering queryset by request user
         return super().get_queryset().filter(user=self.request.user)
+
+    def get_archived_queryset(self):
+        return ArchivedOrder.objects\
+            .filter(user=self.request.user)\
+            .prefetch_related('positions')\
+            .order_by('pk')
     
     def create(self, request, *args, **kwargs):
-        response =  super().create(request, *args, **kwargs)
+        if request.headers.get(idempotency.HEADER):
+            response, _ = idempotency.get_idempotent_response(
+                request,
+                partial(super().create, request, *args, **kwargs)
+            )
+            return response
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            with metrics.phase_timer('order', 'write'):
+                super().perform_create(serializer)
 
-        order_data = response.data
-        order_num = order_data['id']
+            order_num = serializer.instance.pk
 
-        # Sending email to customer
-        email_msg = EmailMessage(
-            subject=f'Создан заказ №{order_num}',
-            to=(request.user.email,)
-        )
-        email_msg.send()
-
-        # Sending email to admins
-        admins_emails_tuples =\
-            User.objects.filter(is_active=True, is_admin=True).values_list('email')
-        admins_emails = set(t[0] for t in admins_emails_tuples)
-        for admin_email in admins_emails:
-            email_msg = EmailMessage(
-                subject=f'Создан заказ №{order_num}',
-                to=(admin_email,)
-            )
-            email_msg.send()
+            with metrics.phase_timer('order', 'email'):
+                # Adding email to customer to outbox
+                OutboxEmail.objects.enqueue(
+                    subject=f'Создан заказ №{order_num}',
+                    to=[self.request.user.email]
+                )
 
-        return response
+                # Adding email to admins to outbox
+                outbox.notify_admins_about_order(order_num)
 
 
 class UserRecipientsViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Recipient.objects.all()
-    serializer_class = RecipientSerializer
+    queryset = UserRecipient.objects.all()
+    serializer_class = UserRecipientSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = LimitOffsetPagination
 
     def get_queryset(self):
-        # Filtering queryset by request user orders
+        # Filtering queryset by request user,
+        # recently used recipients go first
         return super().get_queryset()\
-            .filter(order__user=self.request.user)
-    
-    def list(self, request, *args, **kwargs):
-        default_data = super().list(request, *args, **kwargs).data
-
-        # Deleting duplicates
-        uniqs = set()
-        custom_data = []
-        for recipient in default_data:
-            recipient_str = str(recipient)
-            if recipient_str in uniqs:
-                continue
-            custom_data.append(recipient)
-            uniqs.add(recipient_str)
-
-        return Response(custom_data)
+            .filter(user=self.request.user)\
+            .order_by('-last_used_at', '-pk')
 
 
-class UserShopsOrdersViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Order.objects.all()
+class UserShopsOrdersViewSet(ReplicaReadViewSetMixin,
+                             ArchivedOrdersMixin,
+                             viewsets.ReadOnlyModelViewSet):
+    queryset = Order.objects.select_related('recipient__address')
     serializer_class = OrderSerializerForShop
+    archived_serializer_class = ArchivedOrderSerializerForShop
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'created_at']
 
     def get_queryset(self):
         # Filtering queryset by request user shops positions
+        # and getting only these positions
+        user_shops_orders_positions = self.get_user_shops_orders_positions()
         return super().get_queryset()\
-            .filter(positions__shop_position__shop__representatives=\
-                    self.request.user)\
-            .distinct()
-    
-    def list(self, request, *args, **kwargs):
-        default_data = super().list(request, *args, **kwargs).data
-        custom_data =\
-            self.filter_positions_by_user_shops(default_data, many=True)
-        return Response(custom_data)
+            .filter(pk__in=user_shops_orders_positions.values('order'))\
+            .prefetch_related(
+                Prefetch('positions', queryset=user_shops_orders_positions)
+            )
 
-    def retrieve(self, request, *args, **kwargs):
-        default_data = super().retrieve(request, *args, **kwargs).data
-        custom_data =\
-            self.filter_positions_by_user_shops(default_data)
-        return Response(custom_data)
+    def get_archived_queryset(self):
+        # Filtering archived orders by request user shops positions
+        # and getting only these positions
+        user_shops_archived_orders_positions = ArchivedOrderPosition.objects\
+            .filter(shop__in=self.get_user_shops_ids())
+        return ArchivedOrder.objects\
+            .filter(pk__in=user_shops_archived_orders_positions.values('order'))\
+            .prefetch_related(
+                Prefetch('positions',
+                         queryset=user_shops_archived_orders_positions)
+            )\
+            .order_by('pk')
+
+    @action(detail=False, methods=['post'])
+    def status(self, request):
+        'Changing status of orders by status transitions'
+        serializer = OrdersStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders_ids = set(serializer.validated_data['orders'])
+        new_status = serializer.validated_data['status']
+
+        db_user_shops_orders = Order.objects.filter(
+            pk__in=self.get_user_shops_orders_positions().values('order')
+        )
+        # Status of order is common for all its shops, so it is changed
+        # only if all positions of order belong to user shops
+        db_other_shops_orders_positions = OrderPosition.objects\
+            .exclude(shop__in=self.get_user_shops_ids())
+        changed_orders_ids = db_user_shops_orders\
+            .filter(pk__in=orders_ids)\
+            .exclude(pk__in=db_other_shops_orders_positions.values('order'))\
+            .change_status(new_status)
+
+        # Getting errors for not changed orders
+        errors = dict()
+        not_changed_orders_ids = orders_ids - set(changed_orders_ids)
+        if not_changed_orders_ids:
+            db_orders_statuses = dict(
+                db_user_shops_orders
+                    .filter(pk__in=not_changed_orders_ids)
+                    .values_list('pk', 'status')
+            )
+            other_shops_orders_ids = set(
+                db_other_shops_orders_positions
+                    .filter(order__in=db_orders_statuses.keys())
+                    .values_list('order', flat=True)
+            )
+            for order_id in sorted(not_changed_orders_ids):
+                if order_id not in db_orders_statuses:
+                    errors[f'order_id={order_id}'] = [
+                        'Order was not found.'
+                    ]
+                elif order_id in other_shops_orders_ids:
+                    errors[f'order_id={order_id}'] = [
+                        'Order contains positions of other shops.'
+                    ]
+                else:
+                    errors[f'order_id={order_id}'] = [
+                        f'Changing status from'
+                        f' {db_orders_statuses[order_id]} to {new_status}'
+                        f' is not allowed.'
+                    ]
 
-    def filter_positions_by_user_shops(self, data, many: bool = False):
-        user_shops_ids_tuples = Shop.objects\
-            .filter(representatives=self.request.user).values_list('id')
-        user_shops_ids = set(t[0] for t in user_shops_ids_tuples)
+        resp_data = {
+            'changed': sorted(changed_orders_ids),
+            'errors': errors
+        }
+        return Response(resp_data)
 
-        if not many:
-            order_data = data.copy()
-            order_positions_data = order_data.pop('positions')
-            order_data['positions'] = []
-            for order_pos in order_positions_data:
-                shop_id = order_pos['shop_position']['shop']['id']
-                if shop_id in user_shops_ids:
-                    order_data['positions'].append(order_pos)
-            return order_data
-        else:
-            orders_data = []
-            for order_data in data:
-                orders_data.append(
-                    self.filter_positions_by_user_shops(order_data)
-                )
-            return orders_data
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        'Exporting user shops orders positions to CSV or XLSX file'
+        file_format = request.query_params.get('file_format') or 'csv'
+        if file_format not in export.FILE_FORMATS:
+            errors = {
+                'file_format': [f'Expected one of: {export.FILE_FORMATS}.']
+            }
+            raise ValidationError(errors)
 
+        db_orders_positions = self.get_user_shops_orders_positions()
+        if request.query_params.get('status'):
+            db_orders_positions = db_orders_positions\
+                .filter(order__status=request.query_params['status'])
 
-def create_confirmation_code(user) -> ConfirmationCode:
-    try:
-        user.confirmation_code.delete()
-    except User.confirmation_code.RelatedObjectDoesNotExist:
-        pass
-    
-    confirmation_code = ConfirmationCode(
-        user=user,
-        value=ConfirmationCode.generate()
-    )
-    confirmation_code.save()
+        return export.get_export_response(
+            db_orders_positions,
+            file_format,
+            is_async=isinstance(request._request, ASGIRequest)
+        )
+
+    def get_user_shops_orders_positions(self):
+        return OrderPosition.objects\
+            .filter(shop__in=self.get_user_shops_ids())
+
+    def get_user_shops_ids(self) -> list:
+        # Getting request user shops ids once per request
+        if not hasattr(self, '_user_shops_ids'):
+            self._user_shops_ids = list(
+                Shop.objects
+                    .filter(representatives=self.request.user)
+                    .values_list('id', flat=True)
+            )
+        return self._user_shops_ids
 
-    return confirmation_code
+
+def check_confirmation_code(confirmation_code_store, user, value: str):
+    code_is_valid = confirmation_code_store.check(user, value)
+    if code_is_valid is None:
+        errors = {
+            'error': ['Confirmation code for this user was not found.']
+        }
+        raise ValidationError(errors, status.HTTP_404_NOT_FOUND)
+    if not code_is_valid:
+        errors = {
+            'confirmation_code': ['This code is invalid.']
+        }
+        raise ValidationError(errors)
 
 def send_confirmation_code_by_email(user, email_subject: str):
-    confirmation_code = create_confirmation_code(user)
-    
-    email_msg = EmailMessage(
-        subject=email_subject,
-        body=confirmation_code.value,
-        to=(user.email,)
-    )
-    if email_msg.send():
-        confirmation_code.sent_at = django_timezone.now()
-        confirmation_code.save()
+    'Adding email with new confirmation code to outbox'
+    with transaction.atomic():
+        confirmation_code = get_confirmation_code_store().create(user)
+
+        # Code is marked as sent on delivery
+        OutboxEmail.objects.enqueue(
+            subject=email_subject,
+            body=confirmation_code,
+            to=[user.email],
+            confirmation_code_user=user,
+            confirmation_code=confirmation_code
+        )
@@ -0,0 +1,21 @@
+'''
+Gunicorn settings, loaded by gunicorn from the working directory.
+'''
+import os
+import shutil
+
+# Worker processes write metrics to files of this directory, it must be
+# set before importing prometheus_client
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    '/tmp/orders_metrics')
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Deleting metrics of the previous run
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
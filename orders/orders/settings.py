@@ -47,21 +47,40 @@ INSTALLED_APPS = [
 ]
 
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
-    ]
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    # Token buckets "capacity/period" of api.throttling classes
+    'DEFAULT_THROTTLE_RATES': {
+        'read': os.getenv('THROTTLE_RATE_READ') or '120/min',
+        'search': os.getenv('THROTTLE_RATE_SEARCH') or '30/min',
+        'import': os.getenv('THROTTLE_RATE_IMPORT') or '10/hour',
+    }
 }
 
+THROTTLE_CACHE_ALIAS = 'default'
+
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.db_routers.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Token of metrics scraper, without it "/metrics" endpoint is available
+# only in debug mode
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 ROOT_URLCONF = 'orders.urls'
 
 TEMPLATES = [
@@ -86,6 +105,12 @@ WSGI_APPLICATION = 'orders.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Persistent connections are kept DB_CONN_MAX_AGE seconds and checked
+# before reuse. If DB_POOL_MAX_SIZE is set, connections are taken from
+# the pool of each process (PostgreSQL with psycopg 3 only).
+
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE') or 0)
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE'),
@@ -94,9 +119,122 @@ DATABASES = {
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PWD'),
         'NAME': os.getenv('DB_NAME'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE') or 60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+if DB_POOL_MAX_SIZE:
+    DATABASES['default'].update({
+        'ENGINE': 'api.db_backends.pooled_postgresql',
+        # Connection is returned to the pool at the end of request
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE') or 1),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT') or 30),
+            'max_idle': int(os.getenv('DB_POOL_MAX_IDLE') or 10 * 60),
+        },
+    })
+
+# Replicas of the database "host[:port]" separated by commas. Reads of
+# products and orders listings are sent to replicas, user is pinned to
+# the primary database for DB_REPLICA_PIN_TIME seconds after changes.
+
+DB_REPLICAS = []
+for i, replica in enumerate(filter(None, (os.getenv('DB_REPLICAS') or '')
+                                         .split(','))):
+    replica_host, _, replica_port = replica.strip().partition(':')
+    DATABASES[f'replica_{i}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DB_REPLICAS.append(f'replica_{i}')
+
+DB_REPLICA_PIN_TIME = int(os.getenv('DB_REPLICA_PIN_TIME') or 10)
+DB_REPLICA_PIN_CACHE_ALIAS = 'default'
+
+DATABASE_ROUTERS = ['api.db_routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': (os.getenv('CACHE_BACKEND')
+                    or 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+
+# Serving profile: 'wsgi' (gunicorn sync workers) or 'asgi' (gunicorn
+# uvicorn workers with async views of read endpoints)
+
+SERVER_PROFILE = os.getenv('SERVER_PROFILE') or 'wsgi'
+ASYNC_READ_VIEWS = SERVER_PROFILE == 'asgi'
+
+
+# Users carts storage: 'db' or 'cache'
+
+CART_STORAGE = os.getenv('CART_STORAGE') or 'db'
+CART_CACHE_ALIAS = 'default'
+CART_CACHE_TIMEOUT = int(os.getenv('CART_CACHE_TIMEOUT') or 7 * 24 * 60 * 60)
+
+
+# Caching users of authentication tokens: maximum number of tokens
+# in the cache of each process, caching time in seconds and using
+# of the shared Django cache
+
+TOKEN_AUTH_CACHE_SIZE = int(os.getenv('TOKEN_AUTH_CACHE_SIZE') or 10000)
+TOKEN_AUTH_CACHE_TTL = int(os.getenv('TOKEN_AUTH_CACHE_TTL') or 30)
+TOKEN_AUTH_SHARED_CACHE = bool(os.getenv('TOKEN_AUTH_SHARED_CACHE'))
+TOKEN_AUTH_CACHE_ALIAS = 'default'
+
+
+# Storage of confirmation codes: 'db' or 'cache', time of codes validity
+# in seconds and number of invalid attempts before deleting code
+
+CONFIRMATION_CODE_STORAGE = os.getenv('CONFIRMATION_CODE_STORAGE') or 'db'
+CONFIRMATION_CODE_CACHE_ALIAS = 'default'
+CONFIRMATION_CODE_TTL =\
+    int(os.getenv('CONFIRMATION_CODE_TTL') or 24 * 60 * 60)
+CONFIRMATION_CODE_MAX_ATTEMPTS =\
+    int(os.getenv('CONFIRMATION_CODE_MAX_ATTEMPTS') or 5)
+
+
+# Time of holding shop positions quantity for user cart in seconds
+
+STOCK_HOLD_TTL = int(os.getenv('STOCK_HOLD_TTL') or 10 * 60)
+
+
+# Time of storing responses for idempotency keys in seconds
+
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL') or 24 * 60 * 60)
+
+
+# Minimal age of delivered and canceled orders moved to archive in days
+
+ORDERS_ARCHIVE_AGE_DAYS = int(os.getenv('ORDERS_ARCHIVE_AGE_DAYS') or 365)
+
+
+# Sending emails from outbox: number of attempts before marking email
+# as not sent and delay before the first retry in seconds
+# (it is doubled for every next retry)
+
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS') or 8)
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_RETRY_DELAY') or 60)
+
+
+# Interval of digest emails to admins about new orders in seconds
+# (0 - email about every order)
+
+ADMIN_ORDERS_DIGEST_INTERVAL =\
+    int(os.getenv('ADMIN_ORDERS_DIGEST_INTERVAL') or 0)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -143,10 +281,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'api.User'
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND')\
+    or 'api.mail_backends.PooledEmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_USE_SSL = bool(os.getenv('EMAIL_USE_SSL'))
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
+
+# Pool of SMTP connections of PooledEmailBackend: maximum number of open
+# connections kept in the pool of each process and their idle timeout
+# in seconds
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE') or 4)
+EMAIL_POOL_IDLE_TIMEOUT = int(os.getenv('EMAIL_POOL_IDLE_TIMEOUT') or 60)